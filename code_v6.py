@@ -1,77 +1,97 @@
 import tkinter as tk
-from tkinter import messagebox
-from PIL import Image, ImageTk
-import cv2
-import numpy as np
-import os
+from tkinter import messagebox, ttk
+import argparse
+import queue
+import sys
+import threading
+
+from lunar_stats import AnalysisStats, DISABLED_STATS
+
+
+POLL_INTERVAL_MS = 50                                              # Intervalo de leitura da fila de resultados
 
 
 class LunarFeOAnalyzer:
-    def __init__(self, root):
+    def __init__(self, root, stats=None):
         """
         Inicialização da interface gráfica e configuração inicial
+        A janela é exibida imediatamente e o mosaico é carregado em segundo plano
+        stats recebe uma AnalysisStats para medir as etapas de cada análise
         """
         # Configuração da janela principal
         self.root = root                                           # Armazena referência da janela principal
         self.root.title("Analisador de FeO - Solo Lunar")         # Define título conforme imagem
-        self.root.geometry("550x570")                              # Ajusta dimensões para corresponder à interface
+        self.root.geometry("550x600")                              # Ajusta dimensões para corresponder à interface
         self.root.resizable(0,0)                                    # Defeine que a dimensão da janela é fixa
         self.root.configure(bg="lightgray")                        # Define cor de fundo da janela
         
-        # Inicialização das variáveis de imagem
-        self.clementine_image = None                               # Variável para armazenar imagem principal
-        #self.scale_image = None                                    # Variável para armazenar escala de cores
+        # Núcleo de análise, anexado quando o mosaico terminar de carregar
+        self.core = None                                           # Instância de LunarFeOCore
+        self.stats = stats or DISABLED_STATS                       # Medição das etapas da análise
         
-        # Carregamento e validação das imagens
-        if not self.load_images():                                 # Chama função de carregamento
-            return                                                 # Interrompe inicialização se falhar
+        # Estado da análise em segundo plano
+        self.analysis_queue = queue.Queue()                        # Mensagens da thread de análise
+        self.cancel_event = threading.Event()                      # Sinaliza cancelamento da análise
+        self.worker = None                                         # Thread da análise em andamento
+        self.running_request = None                                # Coordenadas em análise
+        self.pending_request = None                                # Próxima análise (último clique)
         
         # Configuração da interface gráfica
         self.setup_interface()                                     # Chama função de configuração da interface
         
+        # Carregamento e validação das imagens em segundo plano
+        self.start_loading()                                       # Chama função de carregamento
+        
+    def start_loading(self):
+        """
+        Inicia o carregamento do mosaico em uma thread separada da interface
+        """
+        self.progress_bar.config(mode="indeterminate")             # Progresso sem duração conhecida
+        self.progress_bar.start()                                  # Anima a barra durante o carregamento
+        threading.Thread(target=self.load_images, daemon=True).start()
+        self.root.after(POLL_INTERVAL_MS, self.poll_loading)       # Agenda verificação do carregamento
+        
     def load_images(self):
         """
-        Carrega e valida as imagens necessárias para a análise
-        Retorna True se bem-sucedido, False caso contrário
+        Carrega e valida as imagens necessárias para a análise na thread de carregamento
+        As bibliotecas pesadas (NumPy, OpenCV) só são importadas aqui, fora da thread da interface
         """
         try:
-            # Verifica se os arquivos de imagem existem
-            clementine_path = "clementine.tif"                     # Define caminho da imagem principal
-            scale_path = "escala-clementine.jpeg"                   # Define caminho da escala
+            import lunar_core                                      # Importação lenta, feita sob demanda
+        except ImportError as e:                                   # Dependência ausente
+            self.analysis_queue.put(("load_error", f"Erro inesperado ao carregar imagens: {str(e)}"))
+            return
             
-            # Verificação de existência dos arquivos
-            if not os.path.exists(clementine_path):                # Verifica se arquivo principal existe
-                messagebox.showerror("Erro", f"Arquivo '{clementine_path}' não encontrado.")
-                return False
-                
-            if not os.path.exists(scale_path):                     # Verifica se arquivo de escala existe
-                messagebox.showerror("Erro", f"Arquivo '{scale_path}' não encontrado.")
-                return False
+        try:
+            core = lunar_core.LunarFeOCore(decoded_cache=True,     # Reaproveita o mosaico já decodificado
+                                           stats=self.stats)
+            core.load_images()                                     # Carrega imagens pelo núcleo de análise
+            self.analysis_queue.put(("loaded", core))
             
-            # Carregamento das imagens
-            self.clementine_image = cv2.imread(clementine_path)    # Carrega imagem principal usando OpenCV
-            #self.scale_image = cv2.imread(scale_path)              # Carrega escala de cores usando OpenCV
+        except lunar_core.ImageLoadError as e:                     # Captura falhas de validação das imagens
+            self.analysis_queue.put(("load_error", str(e)))
+        except Exception as e:                                     # Captura qualquer exceção durante carregamento
+            self.analysis_queue.put(("load_error", f"Erro inesperado ao carregar imagens: {str(e)}"))
             
-            # Validação de carregamento bem-sucedido
-            if self.clementine_image is None:                      # Verifica se imagem principal foi carregada
-                messagebox.showerror("Erro", f"Falha ao carregar '{clementine_path}'. Verifique se é uma imagem válida.")
-                return False
-            """    
-            if self.scale_image is None:                           # Verifica se escala foi carregada
-                messagebox.showerror("Erro", f"Falha ao carregar '{scale_path}'. Verifique se é uma imagem válida.")
-                return False
-            """
-            # Verificação de dimensões mínimas
-            height, width = self.clementine_image.shape[:2]        # Obtém dimensões da imagem
-            if height < 10 or width < 10:                          # Verifica se dimensões são válidas
-                messagebox.showerror("Erro", "Imagem Clementine muito pequena para análise.")
-                return False
-                
-            return True                                            # Retorna True se tudo estiver correto
+    def poll_loading(self):
+        """
+        Verifica, na thread da interface, se o carregamento do mosaico terminou
+        """
+        try:
+            kind, payload = self.analysis_queue.get_nowait()       # Mensagem da thread de carregamento
+        except queue.Empty:
+            self.root.after(POLL_INTERVAL_MS, self.poll_loading)   # Continua aguardando
+            return
             
-        except Exception as e:                                     # Captura qualquer exceção durante carregamento
-            messagebox.showerror("Erro", f"Erro inesperado ao carregar imagens: {str(e)}")
-            return False
+        self.progress_bar.stop()                                   # Encerra a animação da barra
+        self.progress_bar.config(mode="determinate", value=0)      # Volta ao progresso da análise
+        if kind == "loaded":                                       # Mosaico pronto para análise
+            self.core = payload
+            self.execute_button.config(state="normal")             # Habilita análises
+            self.waiting_label.config(text="Aguardando análise...")
+        else:                                                      # Falha no carregamento
+            self.waiting_label.config(text="Mosaico não carregado.")
+            messagebox.showerror("Erro", payload)
         
     def setup_interface(self):
         """
@@ -127,11 +147,21 @@ Insira apenas números inteiros"""
         self.min_ol_entry = tk.Entry(coordinates_frame, font=("Arial", 12), width=10)  # Campo entrada mínimo OL
         self.min_ol_entry.pack(anchor="w")           # Posiciona campo com padding maior
         
-        # Botão Executar
-        execute_button = tk.Button(coordinates_frame, text="Executar", 
+        # Botões Executar e Cancelar
+        buttons_frame = tk.Frame(coordinates_frame, bg="lightgray")  # Frame para os botões
+        buttons_frame.pack(pady=(10, 4))                           # Posiciona frame centralizado
+        self.execute_button = tk.Button(buttons_frame, text="Executar", 
                                  command=self.execute_analysis,     # Define comando do botão
-                                 font=("Arial", 12), width=12)      # Configurações do botão executar
-        execute_button.pack(pady=10)                               # Posiciona botão centralizado
+                                 font=("Arial", 12), width=12, state="disabled")  # Habilitado após carregar
+        self.execute_button.pack(side="left", padx=5)              # Posiciona botão à esquerda
+        self.cancel_button = tk.Button(buttons_frame, text="Cancelar", 
+                                 command=self.cancel_analysis,      # Define comando do botão
+                                 font=("Arial", 12), width=12, state="disabled")  # Habilitado durante análise
+        self.cancel_button.pack(side="left", padx=5)               # Posiciona botão à direita
+        
+        # Indicador de progresso da leitura da região
+        self.progress_bar = ttk.Progressbar(coordinates_frame, length=300, mode="determinate", maximum=100)
+        self.progress_bar.pack(pady=(0, 6))                        # Posiciona barra abaixo dos botões
         
         # Seção de Resultado
         result_main_frame = tk.Frame(self.root, bg="lightgray")  # Frame principal resultado
@@ -149,163 +179,127 @@ Insira apenas números inteiros"""
         
         # Mensagem inicial de aguardo
         self.waiting_label = tk.Label(self.result_frame, 
-                                    text="Aguardando análise...", 
+                                    text="Carregando mosaico...", 
                                     font=("Arial", 12), bg="lightgray")  # Label de aguardo inicial
         self.waiting_label.pack(pady=2)                           # Posiciona label com padding
         
-    def geographic_to_pixel(self, lat, lon, image_height, image_width):
-        """
-        Conversão de coordenadas geográficas para coordenadas de pixel
-        """
-        # Conversão latitude (Norte-Sul) para coordenada Y de pixel
-        pixel_y = int((90 - lat) * image_height / 180)             # Calcula coordenada Y
-        
-        # Conversão longitude (Oeste-Leste) para coordenada X de pixel  
-        pixel_x = int((lon + 180) * image_width / 360)             # Calcula coordenada X
-        
-        # Garante que as coordenadas estão dentro dos limites da imagem
-        pixel_x = max(0, min(pixel_x, image_width - 1))            # Limita X aos bounds da imagem
-        pixel_y = max(0, min(pixel_y, image_height - 1))           # Limita Y aos bounds da imagem
-        
-        return pixel_x, pixel_y                                    # Retorna coordenadas de pixel
-        
-    def get_area_average_color(self, image, x1, y1, x2, y2):
+    def execute_analysis(self):
         """
-        Extrai a cor média de uma área retangular da imagem
+        Lê e valida os dados inseridos pelo usuário e inicia a análise em segundo plano
+        Cliques repetidos não enfileiram análises duplicadas: a mesma região em andamento é
+        ignorada e uma região diferente substitui a análise atual
         """
-        # Obtém dimensões da imagem
-        height, width = image.shape[:2]                            # Obtém altura e largura da imagem
-        
-        # Garante que todas as coordenadas estão dentro dos limites válidos
-        x1 = max(0, min(x1, width-1))                              # Limita x1 aos bounds da imagem
-        x2 = max(0, min(x2, width-1))                              # Limita x2 aos bounds da imagem
-        y1 = max(0, min(y1, height-1))                             # Limita y1 aos bounds da imagem
-        y2 = max(0, min(y2, height-1))                             # Limita y2 aos bounds da imagem
-        
-        # Garante ordem correta das coordenadas
-        if x1 > x2:                                                # Se x1 maior que x2
-            x1, x2 = x2, x1                                        # Troca valores de x1 e x2
-        if y1 > y2:                                                # Se y1 maior que y2
-            y1, y2 = y2, y1                                        # Troca valores de y1 e y2
+        try:
+            with self.stats.stage("parse"):                        # Mede leitura e validação da entrada
+                # Obtenção dos valores de entrada
+                max_ns = int(self.max_ns_entry.get())              # Converte entrada max NS para inteiro
+                min_ns = int(self.min_ns_entry.get())              # Converte entrada min NS para inteiro  
+                max_ol = int(self.max_ol_entry.get())              # Converte entrada max OL para inteiro
+                min_ol = int(self.min_ol_entry.get())              # Converte entrada min OL para inteiro
+                
+                # Validação dos valores
+                self.core.validate_input_values(max_ns, min_ns, max_ol, min_ol)  # Valida valores inseridos
+                
+        except ValueError as e:                                    # Captura erros de valor
+            messagebox.showerror("Erro de Entrada", f"Erro nos dados inseridos: {str(e)}")
+            return                                                 # Interrompe execução
+        except Exception as e:                                     # Captura outros erros
+            messagebox.showerror("Erro", f"Erro inesperado: {str(e)}")
+            return                                                 # Interrompe execução
             
-        # Verifica se a área é válida
-        if x2 - x1 < 1 or y2 - y1 < 1:                             # Se área muito pequena
-            x2 = x1 + 1                                            # Define x2 como x1 + 1
-            y2 = y1 + 1                                            # Define y2 como y1 + 1
+        request = (max_ns, min_ns, max_ol, min_ol)                 # Coordenadas da análise
+        
+        # Análise em andamento: agrupa os cliques em vez de enfileirar duplicatas
+        if self.worker is not None:
+            if request == self.running_request and not self.cancel_event.is_set():
+                self.pending_request = None                        # Mesma região: mantém a atual
+            else:
+                self.pending_request = request                     # Nova região: substitui a atual
+                self.cancel_event.set()
+            return
             
-        # Extrai a região de interesse
-        roi = image[y1:y2, x1:x2]                                  # Corta área específica da imagem
+        self.start_analysis(request)                               # Inicia a análise
         
-        # Calcula a cor média da região
-        average_color = np.mean(roi, axis=(0, 1))                  # Calcula média nos eixos 0 e 1
-        return average_color                                       # Retorna cor média como array BGR
-        
-    def compare_with_scale(self, target_color):
+    def start_analysis(self, request):
         """
-        Compara a cor extraída com a escala de cores para determinar o percentual de FeO
+        Inicia a análise de uma região em uma thread separada da interface
         """
-        # Converte cor de BGR para RGB
-        target_rgb = [target_color[2], target_color[1], target_color[0]]  # Inverte ordem BGR->RGB
-        
-        # Cores de referência da escala com seus respectivos valores de FeO
-        reference_colors = [
-            ([30, 60, 255], 0),        # Azul escuro - 0% FeO
-            ([0, 120, 255], 2),        # Azul - 2% FeO  
-            ([0, 180, 255], 4),        # Azul claro - 4% FeO
-            ([0, 220, 200], 6),        # Ciano - 6% FeO
-            ([0, 255, 150], 8),        # Verde-azul - 8% FeO
-            ([50, 255, 50], 10),       # Verde - 10% FeO
-            ([150, 255, 0], 12),       # Verde-amarelo - 12% FeO
-            ([220, 220, 0], 14),       # Amarelo - 14% FeO
-            ([255, 180, 0], 16),       # Laranja - 16% FeO
-            ([255, 120, 0], 18),       # Laranja-avermelhado - 18% FeO
-            ([255, 50, 0], 20)         # Vermelho - 20% FeO
-        ]
-        
-        # Encontra a cor mais próxima usando distância euclidiana
-        min_distance = float('inf')                                # Inicializa com distância infinita
-        closest_feo = 0                                            # Inicializa valor de FeO mais próximo
-        
-        for ref_color, feo_value in reference_colors:              # Para cada cor e valor FeO
-            # Calcula distância euclidiana
-            distance = np.sqrt(sum((target_rgb[i] - ref_color[i])**2 for i in range(3)))  # Distância 3D
-            if distance < min_distance:                            # Se distância é menor
-                min_distance = distance                            # Atualiza distância mínima
-                closest_feo = feo_value                            # Atualiza valor FeO mais próximo
-                
-        return closest_feo                                         # Retorna percentual FeO
+        self.cancel_event.clear()                                  # Limpa cancelamentos anteriores
+        self.running_request = request                             # Registra região em análise
+        self.progress_bar["value"] = 0                             # Reinicia barra de progresso
+        self.cancel_button.config(state="normal")                  # Habilita cancelamento
         
-    def determine_associated_element(self, feo_percentage):
+        self.worker = threading.Thread(target=self.run_analysis, args=(request,), daemon=True)
+        self.worker.start()                                        # Executa fora da thread da interface
+        self.root.after(POLL_INTERVAL_MS, self.poll_analysis)      # Agenda leitura dos resultados
+        
+    def run_analysis(self, request):
         """
-        Determina o elemento associado baseado na concentração de FeO
+        Executa a análise na thread de trabalho e envia o resultado pela fila
         """
-        if feo_percentage < 8.6:                                   # Se FeO menor que 8.6%
-            return "Al (Alumínio) e Pode conter argila"  # Retorna Alumínio
-        elif 8.6 <= feo_percentage <= 15.9:                       # Se FeO entre 8.6% e 15.9%
-            return "Si (Silício)"   # Retorna Silício
-        else:                                                      # Se FeO maior que 15.9%
-            return "Ti (Titânio) e Pode conter argila"                             # Retorna Titânio
+        from lunar_core import AnalysisCancelled                   # Módulo já carregado com o mosaico
+        
+        def report_progress(done, total):                          # Chamado a cada parte lida da região
+            if self.cancel_event.is_set():                         # Interrompe se cancelado
+                raise AnalysisCancelled()
+            self.analysis_queue.put(("progress", done / total))
             
-    def validate_input_values(self, max_ns, min_ns, max_ol, min_ol):
+        try:
+            result = self.core.analyze_region(*request, progress=report_progress)  # FeO, elemento, cor e pixels
+            if self.cancel_event.is_set():                         # Respondida sem leitura (tabela de somas)
+                raise AnalysisCancelled()
+            self.analysis_queue.put(("result", result))
+        except AnalysisCancelled:                                  # Cancelada pelo usuário
+            self.analysis_queue.put(("cancelled", None))
+        except Exception as e:                                     # Captura outros erros
+            self.analysis_queue.put(("error", e))
+            
+    def poll_analysis(self):
         """
-        Valida os valores de entrada fornecidos pelo usuário
+        Lê as mensagens da thread de análise na thread da interface
         """
-        # Validação dos intervalos Norte-Sul
-        if not (-90 <= min_ns <= max_ns <= 90):                    # Verifica se valores NS estão corretos
-            raise ValueError("Valores Norte-Sul devem estar entre -90 e 90, com mínimo ≤ máximo")
-            
-        # Validação dos intervalos Oeste-Leste  
-        if not (-180 <= min_ol <= max_ol <= 180):                  # Verifica se valores OL estão corretos
-            raise ValueError("Valores Oeste-Leste devem estar entre -180 e 180, com mínimo ≤ máximo")
+        finished = False                                           # Indica se a análise terminou
+        while True:
+            try:
+                kind, payload = self.analysis_queue.get_nowait()   # Próxima mensagem da fila
+            except queue.Empty:
+                break
+                
+            if kind == "progress":                                 # Atualiza a barra de progresso
+                self.progress_bar["value"] = payload * 100
+                continue
+                
+            finished = True
+            if kind == "result" and self.cancel_event.is_set():    # Cancelada após o término: descarta
+                kind = "cancelled"
+            if kind == "result":                                   # Exibe o resultado da análise
+                self.progress_bar["value"] = 100
+                with self.stats.stage("display_results"):          # Mede a reconstrução dos widgets
+                    self.display_results(payload["feo"], payload["element"], payload["color"], 
+                                        self.running_request, payload["pixel_box"])  # Passa coordenadas entrada e pixel
+            elif kind == "error":                                  # Exibe o erro da análise
+                messagebox.showerror("Erro", f"Erro inesperado: {str(payload)}")
+            else:                                                  # Análise cancelada
+                self.progress_bar["value"] = 0
+                
+        if not finished:                                           # Continua aguardando a thread
+            self.root.after(POLL_INTERVAL_MS, self.poll_analysis)
+            return
             
-        # Validação de área mínima
-        ns_range = max_ns - min_ns                                 # Calcula amplitude Norte-Sul
-        ol_range = max_ol - min_ol                                 # Calcula amplitude Oeste-Leste
-        
-        if ns_range < 1 or ol_range < 1:                           # Se área muito pequena
-            raise ValueError("Área selecionada muito pequena. Mínimo 1 grau em cada direção.")
+        # Análise concluída: libera a thread e inicia a próxima região, se houver
+        self.worker = None
+        self.running_request = None
+        self.cancel_button.config(state="disabled")                # Desabilita cancelamento
+        if self.pending_request is not None:
+            request, self.pending_request = self.pending_request, None
+            self.start_analysis(request)
             
-    def execute_analysis(self):
+    def cancel_analysis(self):
         """
-        Executa a análise principal baseada nos dados inseridos pelo usuário
+        Cancela a análise em andamento e descarta a próxima região agendada
         """
-        try:
-            # Obtenção dos valores de entrada
-            max_ns = int(self.max_ns_entry.get())                  # Converte entrada max NS para inteiro
-            min_ns = int(self.min_ns_entry.get())                  # Converte entrada min NS para inteiro  
-            max_ol = int(self.max_ol_entry.get())                  # Converte entrada max OL para inteiro
-            min_ol = int(self.min_ol_entry.get())                  # Converte entrada min OL para inteiro
-            
-            # Validação dos valores
-            self.validate_input_values(max_ns, min_ns, max_ol, min_ol)  # Valida valores inseridos
-                
-        except ValueError as e:                                    # Captura erros de valor
-            messagebox.showerror("Erro de Entrada", f"Erro nos dados inseridos: {str(e)}")
-            return                                                 # Interrompe execução
-        except Exception as e:                                     # Captura outros erros
-            messagebox.showerror("Erro", f"Erro inesperado: {str(e)}")
-            return                                                 # Interrompe execução
-            
-        # Obtenção das dimensões da imagem
-        height, width = self.clementine_image.shape[:2]            # Obtém altura e largura
-        
-        # Conversão de coordenadas geográficas para pixels
-        x1, y1 = self.geographic_to_pixel(max_ns, min_ol, height, width)  # Canto superior esquerdo
-        x2, y2 = self.geographic_to_pixel(min_ns, max_ol, height, width)  # Canto inferior direito
-        
-        # Extração da cor média da área
-        average_color = self.get_area_average_color(self.clementine_image, x1, y1, x2, y2)  # Cor média
-        
-        # Determinação do percentual de FeO
-        feo_percentage = self.compare_with_scale(average_color)    # % FeO baseado na cor
-        
-        # Determinação do elemento associado
-        associated_element = self.determine_associated_element(feo_percentage)  # Elemento químico
-        
-        # Exibição dos resultados com coordenadas de entrada e pixel
-        self.display_results(feo_percentage, associated_element, average_color, 
-                            (max_ns, min_ns, max_ol, min_ol), (x1, y1, x2, y2))  # Passa coordenadas entrada e pixel
-
+        self.pending_request = None                                # Descarta região agendada
+        self.cancel_event.set()                                    # Sinaliza a thread de análise
         
     def display_results(self, feo_percentage, associated_element, color, coordinates_input, coordinates_pixel):
         """
@@ -350,13 +344,29 @@ Insira apenas números inteiros"""
         coord_info.pack(pady=2, anchor="w", padx=10)               # Posiciona info alinhada à esquerda
 
 
-def main():
+def main(argv=None):
     """
     Função principal para inicializar a aplicação
     """
+    parser = argparse.ArgumentParser(description="Analisador de FeO do solo lunar")
+    parser.add_argument("--stats-log", help="grava as medições de cada etapa em JSON por linha ('-' para stderr)")
+    parser.add_argument("--profile", action="store_true", help="captura cProfile e tracemalloc de cada análise")
+    args = parser.parse_args(argv)
+    
+    stats = None                                                   # Instrumentação desativada por padrão
+    log_stream = None
+    if args.stats_log or args.profile:
+        log_stream = sys.stderr if args.stats_log in (None, "-") else open(args.stats_log, "a", encoding="utf-8")
+        stats = AnalysisStats(log_stream=log_stream, profile=args.profile)
+    
     root = tk.Tk()                                                 # Cria janela principal
-    app = LunarFeOAnalyzer(root)                                   # Cria aplicação
+    app = LunarFeOAnalyzer(root, stats)                            # Cria aplicação
     root.mainloop()                                                # Inicia loop GUI
+    
+    if stats is not None:                                          # Resumo das medições ao fechar
+        stats.log_summary()
+        if log_stream is not sys.stderr:
+            log_stream.close()
 
 
 if __name__ == "__main__":                                         # Execução direta
@@ -0,0 +1,281 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from lunar_core import LunarFeOCore, REFERENCE_RGB
+
+
+DEFAULT_SIZES = "0.5,2,8,32"                                       # Tamanhos padrão em megapixels
+DEFAULT_BOX_DEGREES = "1,5,10,30,90,180"                           # Lados das regiões consultadas em graus
+TILED_ABOVE_MP = 256                                               # Acima disso o mosaico é lido em blocos
+GENERATE_BYTES = 256 * 1024 * 1024                                 # Memória de trabalho por faixa gerada
+GENERATE_BYTES_PER_PIXEL = 112                                     # Pico dos temporários float64 de synthetic_rows
+QUERY_REPEATS = 50                                                 # Consultas por tamanho de região
+BATCH_QUERIES = 2000                                               # Consultas no teste de vazão
+BATCH_COLORS = 1 << 20                                             # Cores no teste de classificação em lote
+MEASURE_SECONDS = 5.0                                              # Tempo máximo de cada medição
+MIN_CALLS = 3                                                      # Chamadas mínimas de cada medição
+REGRESSION_THRESHOLD = 0.2                                         # Piora relativa considerada regressão
+
+
+def synthetic_rows(top, bottom, width, height, rng):
+    """
+    Gera as linhas [top, bottom) de um mosaico sintético semelhante ao Clementine (BGR)
+    Um campo suave de baixa frequência escolhe a posição na escala de cores e um ruído
+    leve imita a textura da superfície
+    """
+    rows = np.arange(top, bottom)[:, None] / height                # Latitude normalizada
+    cols = np.arange(width)[None, :] / width                       # Longitude normalizada
+    field = (0.5 + 0.25 * np.sin(2 * np.pi * (3 * cols + rows)) * np.cos(2 * np.pi * 2 * rows)
+             + 0.15 * np.sin(2 * np.pi * 11 * cols) * np.sin(2 * np.pi * 7 * rows))
+    field = np.clip(field + rng.normal(0, 0.03, field.shape), 0, 1)  # Textura da superfície
+
+    # Interpolação linear entre as cores de referência da escala
+    position = field * (len(REFERENCE_RGB) - 1)
+    lower = np.minimum(position.astype(int), len(REFERENCE_RGB) - 2)
+    weight = (position - lower)[:, :, None]
+    rgb = REFERENCE_RGB[lower] * (1 - weight) + REFERENCE_RGB[lower + 1] * weight
+    return np.clip(rgb[:, :, ::-1], 0, 255).astype(np.uint8)       # Converte RGB->BGR
+
+
+def generate_rows(width):
+    """
+    Número de linhas por faixa gerada que respeita o orçamento de memória de trabalho
+    """
+    return max(1, GENERATE_BYTES // max(1, width * GENERATE_BYTES_PER_PIXEL))
+
+
+def write_synthetic_mosaic(directory, megapixels, seed=0, tiled_above=TILED_ABOVE_MP):
+    """
+    Grava um mosaico sintético equiretangular (largura = 2x altura) com o tamanho pedido
+    Mosaicos pequenos são gravados em TIFF; os grandes em .npy, direto em disco
+    Em ambos os casos as linhas são geradas em faixas limitadas por GENERATE_BYTES
+    Retorna o caminho do mosaico e se ele deve ser lido em blocos
+    """
+    import cv2                                                     # Necessário apenas para gravar imagens
+
+    height = max(10, int(round((megapixels * 1e6 / 2) ** 0.5)))    # Altura do mosaico
+    width = 2 * height                                             # Largura do mosaico
+    rng = np.random.default_rng(seed)
+    tiled = megapixels > tiled_above
+
+    if tiled:                                                      # Gerado direto em disco
+        path = os.path.join(directory, f"synthetic_{megapixels}mp.npy")
+        mosaic = np.lib.format.open_memmap(path, mode="w+", dtype=np.uint8, shape=(height, width, 3))
+    else:
+        path = os.path.join(directory, f"synthetic_{megapixels}mp.tif")
+        mosaic = np.empty((height, width, 3), dtype=np.uint8)
+    step = generate_rows(width)
+    for top in range(0, height, step):                             # Gera o mosaico em faixas
+        bottom = min(top + step, height)
+        mosaic[top:bottom] = synthetic_rows(top, bottom, width, height, rng)
+    if tiled:
+        mosaic.flush()
+    else:
+        cv2.imwrite(path, mosaic)
+    del mosaic
+
+    # Escala de cores exigida pela validação do carregamento
+    scale_path = os.path.join(directory, "escala-clementine.jpeg")
+    if not os.path.exists(scale_path):
+        bar = np.repeat(REFERENCE_RGB[None, :, ::-1], 20, axis=0).astype(np.uint8)
+        cv2.imwrite(scale_path, cv2.resize(bar, (220, 20), interpolation=cv2.INTER_NEAREST))
+    return path, scale_path, tiled
+
+
+def time_calls(function, arguments, budget=MEASURE_SECONDS):
+    """
+    Executa a função para cada conjunto de argumentos e retorna as durações em microssegundos
+    Interrompe após 'budget' segundos (com ao menos MIN_CALLS chamadas), o que mantém
+    viáveis as consultas lentas dos mosaicos lidos em blocos
+    """
+    durations = []
+    deadline = time.perf_counter() + budget
+    for args in arguments:
+        start = time.perf_counter()
+        function(*args)
+        durations.append((time.perf_counter() - start) * 1e6)
+        if start > deadline and len(durations) >= MIN_CALLS:
+            break
+    return np.array(durations)
+
+
+def random_boxes(rng, degrees, count):
+    """
+    Regiões aleatórias (max_ns, min_ns, max_ol, min_ol) de 'degrees' graus de latitude
+    por 2x 'degrees' graus de longitude, limitadas ao globo
+    """
+    lat_span = min(degrees, 180)
+    lon_span = min(2 * degrees, 360)
+    boxes = []
+    for _ in range(count):
+        min_ns = rng.uniform(-90, 90 - lat_span)
+        min_ol = rng.uniform(-180, 180 - lon_span)
+        boxes.append((min_ns + lat_span, min_ns, min_ol + lon_span, min_ol))
+    return boxes
+
+
+def benchmark_size(directory, megapixels, box_degrees, seed=0, tiled_above=TILED_ABOVE_MP):
+    """
+    Mede carregamento, latência por tamanho de região, vazão em lote e memória de um mosaico
+    O pico de memória residente é o do processo inteiro; run_benchmarks executa cada tamanho em
+    um processo próprio para que ele se refira apenas a este mosaico
+    """
+    path, scale_path, tiled = write_synthetic_mosaic(directory, megapixels, seed, tiled_above)
+    rng = np.random.default_rng(seed)
+    metrics = {"tiled": tiled}
+
+    # Carregamento (tempo e pico de memória alocada)
+    core = LunarFeOCore(path, scale_path, tiled=tiled, result_cache_size=0)
+    tracemalloc.start()
+    start = time.perf_counter()
+    core.load_images()
+    metrics["load_s"] = time.perf_counter() - start
+    metrics["load_peak_bytes"] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    height, width = core.clementine_image.shape[:2]
+    metrics["height"], metrics["width"] = height, width
+
+    # Conversão de coordenadas e classificação de uma cor
+    points = [(rng.uniform(-90, 90), rng.uniform(-180, 180), height, width) for _ in range(10000)]
+    metrics["geographic_to_pixel_us"] = float(np.median(time_calls(core.geographic_to_pixel, points)))
+    colors = [(rng.uniform(0, 255, 3),) for _ in range(2000)]
+    metrics["compare_with_scale_us"] = float(np.median(time_calls(core.compare_with_scale, colors)))
+
+    # Latência da cor média e da análise completa por tamanho de região
+    for degrees in box_degrees:
+        boxes = random_boxes(rng, degrees, QUERY_REPEATS)
+        pixel_boxes = []
+        for max_ns, min_ns, max_ol, min_ol in boxes:
+            x1, y1 = core.geographic_to_pixel(max_ns, min_ol, height, width)
+            x2, y2 = core.geographic_to_pixel(min_ns, max_ol, height, width)
+            pixel_boxes.append((core.clementine_image, x1, y1, x2, y2))
+        average = time_calls(core.get_area_average_color, pixel_boxes)
+        analysis = time_calls(core.analyze_region, boxes)
+        metrics[f"average_color_{degrees}deg_us"] = float(np.median(average))
+        metrics[f"average_color_{degrees}deg_p95_us"] = float(np.percentile(average, 95))
+        metrics[f"analyze_region_{degrees}deg_us"] = float(np.median(analysis))
+
+    # Vazão em lote: consultas completas e classificação vetorizada de cores
+    durations = time_calls(core.analyze_region, random_boxes(rng, 10, BATCH_QUERIES))
+    metrics["batch_queries_per_s"] = len(durations) / (durations.sum() / 1e6)
+    batch = rng.integers(0, 256, (BATCH_COLORS, 3), dtype=np.uint8)
+    start = time.perf_counter()
+    core.classify_colors(batch, use_lut=False)
+    metrics["classify_colors_per_s"] = BATCH_COLORS / (time.perf_counter() - start)
+
+    # Pico de memória residente do processo até aqui (ru_maxrss em KiB no Linux)
+    metrics["process_peak_rss_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    if tiled:
+        core.clementine_image.close()
+    return metrics
+
+
+def run_benchmarks(sizes, box_degrees, directory=None, keep=False, seed=0, tiled_above=TILED_ABOVE_MP):
+    """
+    Executa o benchmark para cada tamanho de mosaico e retorna o relatório completo
+    Cada tamanho roda em um processo novo, sem a memória dos tamanhos anteriores
+    """
+    work_directory = directory or tempfile.mkdtemp(prefix="lunar_bench_")
+    os.makedirs(work_directory, exist_ok=True)
+    report = {
+        "meta": {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+                 "numpy": np.__version__, "platform": platform.platform(), "cpus": os.cpu_count()},
+        "results": {},
+    }
+    context = multiprocessing.get_context("spawn")                 # Processo novo, não uma cópia do atual
+    try:
+        for megapixels in sizes:                                   # Para cada tamanho de mosaico
+            print(f"Mosaico sintético de {megapixels} MP...", file=sys.stderr)
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                future = pool.submit(benchmark_size, work_directory, megapixels, box_degrees, seed, tiled_above)
+                report["results"][f"{megapixels}mp"] = future.result()
+    finally:
+        if not keep and directory is None:                         # Remove os mosaicos temporários
+            shutil.rmtree(work_directory, ignore_errors=True)
+    return report
+
+
+def higher_is_better(metric):
+    """
+    Indica se valores maiores da métrica são melhores (vazões)
+    """
+    return metric.endswith("_per_s")
+
+
+def compare_reports(baseline, current, threshold=REGRESSION_THRESHOLD):
+    """
+    Compara duas execuções e retorna as métricas que pioraram mais que o limiar relativo
+    Cada item é (tamanho, métrica, valor de referência, valor atual, variação relativa)
+    """
+    regressions = []
+    for size, metrics in current["results"].items():
+        reference = baseline["results"].get(size, {})
+        for metric, value in metrics.items():
+            old = reference.get(metric)
+            if metric in ("height", "width") or isinstance(value, bool) or not old:
+                continue                                           # Dimensões, opções ou métrica ausente
+            change = (value - old) / old                           # Variação relativa
+            if higher_is_better(metric):
+                change = -change                                   # Queda de vazão é piora
+            if change > threshold:
+                regressions.append((size, metric, old, value, change))
+    return regressions
+
+
+def main(argv=None):
+    """
+    Benchmark do pipeline de análise em mosaicos sintéticos, com comparação entre execuções
+    """
+    parser = argparse.ArgumentParser(description="Benchmark do pipeline de análise de FeO em mosaicos sintéticos")
+    parser.add_argument("-o", "--output", help="arquivo JSON com os resultados")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="tamanhos dos mosaicos em megapixels, separados por vírgula")
+    parser.add_argument("--boxes", default=DEFAULT_BOX_DEGREES, help="lados das regiões em graus, separados por vírgula")
+    parser.add_argument("--workdir", help="diretório dos mosaicos sintéticos (padrão: temporário)")
+    parser.add_argument("--keep", action="store_true", help="mantém os mosaicos sintéticos gerados")
+    parser.add_argument("--tiled-above", type=float, default=TILED_ABOVE_MP, help="tamanho em MP a partir do qual o mosaico é lido em blocos")
+    parser.add_argument("--seed", type=int, default=0, help="semente dos dados sintéticos")
+    parser.add_argument("--compare", metavar="BASELINE", help="JSON de uma execução anterior para detectar regressões")
+    parser.add_argument("--current", metavar="RESULTS", help="compara este JSON em vez de executar o benchmark")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD, help="piora relativa tolerada (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    if args.current:                                               # Apenas compara resultados gravados
+        with open(args.current) as handle:
+            report = json.load(handle)
+    else:
+        sizes = [float(size) if "." in size else int(size) for size in args.sizes.split(",")]
+        box_degrees = [int(degrees) for degrees in args.boxes.split(",")]
+        report = run_benchmarks(sizes, box_degrees, args.workdir, args.keep, args.seed, args.tiled_above)
+        text = json.dumps(report, indent=2)
+        if args.output:
+            with open(args.output, "w") as handle:
+                handle.write(text + "\n")
+        else:
+            print(text)
+
+    if not args.compare:
+        return 0
+    with open(args.compare) as handle:
+        baseline = json.load(handle)
+    regressions = compare_reports(baseline, report, args.threshold)
+    for size, metric, old, value, change in regressions:           # Lista as regressões encontradas
+        print(f"REGRESSÃO {size} {metric}: {old:.6g} -> {value:.6g} ({change:+.0%})", file=sys.stderr)
+    if not regressions:
+        print("Nenhuma regressão encontrada.", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":                                         # Execução direta
+    sys.exit(main())                                               # Chama função principal
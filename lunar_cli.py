@@ -0,0 +1,177 @@
+import argparse
+import csv
+import json
+import sys
+
+from lunar_core import LunarFeOCore, ImageLoadError
+from lunar_stats import AnalysisStats
+
+
+# Campos de entrada de cada região (mesma ordem dos campos da interface gráfica)
+INPUT_FIELDS = ["max_ns", "min_ns", "max_ol", "min_ol"]
+
+# Campos de saída de cada região analisada
+OUTPUT_FIELDS = INPUT_FIELDS + ["feo", "element", "mean_b", "mean_g", "mean_r",
+                                "x1", "y1", "x2", "y2", "level", "error"]
+
+# Campos extras da distribuição de classes de FeO (opção --distribution)
+DISTRIBUTION_FIELDS = ["mean_feo", "feo_fractions", "element_fractions"]
+
+
+def detect_format(path, requested):
+    """
+    Determina o formato (csv ou jsonl) de um arquivo a partir da opção ou da extensão
+    """
+    if requested:                                                  # Formato informado explicitamente
+        return requested
+    if path.lower().endswith((".jsonl", ".ndjson", ".json")):      # Extensões de JSON por linha
+        return "jsonl"
+    return "csv"                                                   # CSV como formato padrão
+
+
+def read_regions(stream, input_format):
+    """
+    Lê as regiões de um arquivo CSV (com cabeçalho) ou JSONL, uma por vez
+    """
+    if input_format == "jsonl":
+        for line in stream:                                        # Para cada linha do arquivo
+            line = line.strip()                                    # Remove espaços e quebra de linha
+            if line:                                               # Ignora linhas vazias
+                yield json.loads(line)
+    else:
+        yield from csv.DictReader(stream)                          # Cada linha vira um dicionário
+
+
+def analyze_record(core, record, tolerance=0, distribution=False):
+    """
+    Analisa uma região lida do arquivo de entrada e monta o registro de saída
+    Erros de entrada são registrados no campo 'error' em vez de interromper o lote
+    A leitura das coordenadas é medida como etapa 'parse' da mesma consulta em core.stats
+    """
+    output = {field: record.get(field) for field in INPUT_FIELDS}  # Repete as coordenadas de entrada
+    with core.stats.query(region=None, tolerance=tolerance) as query:  # Consulta aberta antes da leitura
+        try:
+            with core.stats.stage("parse"):
+                values = [float(record[field]) for field in INPUT_FIELDS]  # Converte coordenadas para número
+            if query is not None:
+                query["region"] = values
+            result = core.analyze_region(*values, tolerance=tolerance)  # Executa a análise da região
+            classes = core.analyze_region_distribution(*values) if distribution else None  # Distribuição de classes
+        except (KeyError, TypeError, ValueError) as e:             # Captura registros inválidos
+            output["error"] = str(e)
+            if query is not None:
+                query["error"] = type(e).__name__
+            return output
+
+    blue, green, red = (float(channel) for channel in result["color"])  # Cor média BGR
+    x1, y1, x2, y2 = result["pixel_box"]                           # Caixa de pixels
+    output.update({
+        "feo": round(result["feo"], 3), "element": result["element"],
+        "mean_b": round(blue, 3), "mean_g": round(green, 3), "mean_r": round(red, 3),
+        "x1": x1, "y1": y1, "x2": x2, "y2": y2, "level": result["level"], "error": None,
+    })
+    if classes is not None:                                        # Frações por classe e por elemento
+        output.update({
+            "mean_feo": round(classes["mean_feo"], 3),
+            "feo_fractions": {feo: round(fraction, 6) for feo, fraction in classes["feo_fractions"].items()},
+            "element_fractions": {element: round(fraction, 6)
+                                  for element, fraction in classes["element_fractions"].items()},
+        })
+    return output
+
+
+def write_results(stream, output_format, records, fieldnames=OUTPUT_FIELDS):
+    """
+    Escreve os registros analisados em CSV ou JSONL à medida que são produzidos
+    No CSV, campos compostos (dicionários) são gravados como JSON
+    """
+    if output_format == "jsonl":
+        for record in records:                                     # Para cada registro analisado
+            stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+    else:
+        writer = csv.DictWriter(stream, fieldnames=fieldnames)     # Escritor CSV com cabeçalho fixo
+        writer.writeheader()
+        for record in records:                                     # Para cada registro analisado
+            writer.writerow({field: json.dumps(value, ensure_ascii=False) if isinstance(value, dict) else value
+                             for field, value in record.items()})
+
+
+def open_stream(path, mode):
+    """
+    Abre um arquivo, usando stdin/stdout quando o caminho for '-'
+    """
+    if path == "-":
+        return sys.stdin if "r" in mode else sys.stdout
+    return open(path, mode, newline="", encoding="utf-8")
+
+
+def build_parser():
+    """
+    Configura os argumentos de linha de comando
+    """
+    parser = argparse.ArgumentParser(description="Análise de FeO do solo lunar em lote, sem interface gráfica")
+    parser.add_argument("input", help="arquivo CSV/JSONL com colunas max_ns, min_ns, max_ol, min_ol ('-' para stdin)")
+    parser.add_argument("-o", "--output", default="-", help="arquivo de saída ('-' para stdout)")
+    parser.add_argument("--input-format", choices=["csv", "jsonl"], help="formato da entrada (padrão: pela extensão)")
+    parser.add_argument("--output-format", choices=["csv", "jsonl"], help="formato da saída (padrão: pela extensão)")
+    parser.add_argument("--image", default="clementine.tif", help="caminho da imagem Clementine")
+    parser.add_argument("--scale", default="escala-clementine.jpeg", help="caminho da escala de cores")
+    parser.add_argument("--tiled", action="store_true", help="lê o mosaico em blocos sob demanda (TIFF blocado ou .npy mapeado)")
+    parser.add_argument("--distribution", action="store_true", help="inclui a fração de cada classe de FeO e elemento")
+    parser.add_argument("--tolerance", type=float, default=0, help="tolerância em pixels para responder pela pirâmide de cores (com --tiled)")
+    parser.add_argument("--result-cache", type=int, default=1024, help="regiões analisadas mantidas em cache (0 desativa)")
+    parser.add_argument("--cache-mb", type=int, default=256, help="orçamento do cache de blocos em MB (com --tiled)")
+    parser.add_argument("--dense-palette", action="store_true", help="FeO fracionário pela paleta densa amostrada da escala")
+    parser.add_argument("--stats-log", help="grava as medições de cada região em JSON por linha ('-' para stderr)")
+    parser.add_argument("--profile", action="store_true", help="captura cProfile e tracemalloc de cada região")
+    return parser
+
+
+def main(argv=None):
+    """
+    Função principal da linha de comando: carrega o mosaico uma vez e analisa todas as regiões
+    """
+    args = build_parser().parse_args(argv)
+
+    stats = None                                                   # Instrumentação desativada por padrão
+    stats_stream = None
+    if args.stats_log or args.profile:
+        stats_stream = sys.stderr if args.stats_log in (None, "-") else open(args.stats_log, "a", encoding="utf-8")
+        stats = AnalysisStats(log_stream=stats_stream, profile=args.profile)
+
+    core = LunarFeOCore(args.image, args.scale, tiled=args.tiled,
+                        tile_cache_bytes=args.cache_mb * 1024 * 1024,
+                        result_cache_size=args.result_cache, stats=stats,
+                        dense_palette=args.dense_palette)          # Núcleo de análise sem interface
+    try:
+        core.load_images()                                         # Carrega o mosaico uma única vez
+    except ImageLoadError as e:
+        print(f"Erro: {e}", file=sys.stderr)
+        return 1
+    if args.tolerance > 0 and core.integral_image is None:         # Consultas aproximadas pela pirâmide
+        core.load_pyramid()
+
+    input_format = detect_format(args.input, args.input_format)    # Formato da entrada
+    output_format = detect_format(args.output, args.output_format) # Formato da saída
+
+    input_stream = open_stream(args.input, "r")
+    output_stream = open_stream(args.output, "w")
+    try:
+        records = (analyze_record(core, record, args.tolerance, args.distribution)
+                   for record in read_regions(input_stream, input_format))
+        fieldnames = OUTPUT_FIELDS + DISTRIBUTION_FIELDS if args.distribution else OUTPUT_FIELDS
+        write_results(output_stream, output_format, records, fieldnames)  # Processa em fluxo, sem acumular
+    finally:
+        if input_stream is not sys.stdin:
+            input_stream.close()
+        if output_stream is not sys.stdout:
+            output_stream.close()
+        if stats is not None:                                      # Resumo das medições do lote
+            stats.log_summary()
+            if stats_stream is not sys.stderr:
+                stats_stream.close()
+    return 0
+
+
+if __name__ == "__main__":                                         # Execução direta
+    sys.exit(main())                                               # Chama função principal
@@ -0,0 +1,615 @@
+import numpy as np
+import os
+import threading
+from collections import OrderedDict
+
+from lunar_palette import DensePalette
+from lunar_pyramid import FeOPyramid
+from lunar_raster import (TiledRaster, discard_file, load_decoded, open_raster, sidecar_is_valid, write_signature,
+                          DEFAULT_CACHE_BYTES)
+from lunar_stats import DISABLED_STATS
+
+
+# Cores de referência da escala (RGB) com seus respectivos valores de FeO
+REFERENCE_COLORS = [
+    ([30, 60, 255], 0),        # Azul escuro - 0% FeO
+    ([0, 120, 255], 2),        # Azul - 2% FeO  
+    ([0, 180, 255], 4),        # Azul claro - 4% FeO
+    ([0, 220, 200], 6),        # Ciano - 6% FeO
+    ([0, 255, 150], 8),        # Verde-azul - 8% FeO
+    ([50, 255, 50], 10),       # Verde - 10% FeO
+    ([150, 255, 0], 12),       # Verde-amarelo - 12% FeO
+    ([220, 220, 0], 14),       # Amarelo - 14% FeO
+    ([255, 180, 0], 16),       # Laranja - 16% FeO
+    ([255, 120, 0], 18),       # Laranja-avermelhado - 18% FeO
+    ([255, 50, 0], 20)         # Vermelho - 20% FeO
+]
+REFERENCE_RGB = np.array([color for color, _ in REFERENCE_COLORS], dtype=np.float64)  # Matriz (11, 3) das cores
+REFERENCE_NORM = np.sum(REFERENCE_RGB ** 2, axis=1)               # Norma ao quadrado de cada cor
+REFERENCE_FEO = np.array([feo for _, feo in REFERENCE_COLORS], dtype=np.uint8)       # Vetor (11,) de FeO
+CLASSIFY_CHUNK_SIZE = 1 << 18                                      # Cores por bloco na classificação vetorizada
+READ_CHUNK_PIXELS = 1 << 22                                        # Pixels por faixa na leitura de regiões
+DEFAULT_RESULT_CACHE_SIZE = 256                                    # Regiões analisadas mantidas em cache
+INTEGRAL_SUFFIX = ".integral.npy"                                  # Tabela de somas gravada ao lado da imagem
+
+
+class ImageLoadError(Exception):
+    """
+    Erro ao carregar ou validar as imagens necessárias para a análise
+    """
+
+
+class AnalysisCancelled(Exception):
+    """
+    Análise interrompida a pedido do usuário durante a leitura da região
+    """
+
+
+class LunarFeOCore:
+    def __init__(self, clementine_path="clementine.tif", scale_path="escala-clementine.jpeg",
+                 tiled=False, tile_cache_bytes=DEFAULT_CACHE_BYTES, precompute=True, decoded_cache=False,
+                 result_cache_size=DEFAULT_RESULT_CACHE_SIZE, stats=None, dense_palette=False):
+        """
+        Inicialização do núcleo de análise, independente de interface gráfica
+        Com tiled=True o mosaico é lido em blocos sob demanda em vez de decodificado inteiro
+        Com precompute=False as tabelas acumuladas não são construídas no carregamento
+        (as contagens por classe de FeO são construídas apenas na primeira distribuição pedida)
+        Com decoded_cache=True o mosaico decodificado e a tabela de somas são gravados em arquivos
+        .npy ao lado da imagem e mapeados em memória nas execuções seguintes, evitando nova
+        decodificação e novo pré-cálculo; se não puderem ser gravados, ficam apenas em memória
+        result_cache_size limita quantas regiões analisadas ficam em cache (0 desativa)
+        stats recebe uma AnalysisStats para medir etapas e contadores (desativada por padrão)
+        Com dense_palette=True o FeO é fracionário, obtido da paleta densa amostrada da escala
+        """
+        # Caminhos das imagens
+        self.clementine_path = clementine_path                     # Caminho da imagem principal
+        self.scale_path = scale_path                               # Caminho da escala de cores
+        self.tiled = tiled                                         # Usa leitura em blocos do mosaico
+        self.tile_cache_bytes = tile_cache_bytes                   # Orçamento do cache de blocos
+        self.precompute = precompute                               # Constrói tabelas acumuladas ao carregar
+        self.decoded_cache = decoded_cache                         # Reaproveita o mosaico já decodificado
+        self.stats = stats or DISABLED_STATS                       # Instrumentação por etapa
+        self.dense_palette = dense_palette                         # Usa a paleta densa da escala
+        
+        # Inicialização das variáveis de imagem
+        self.clementine_image = None                               # Variável para armazenar imagem principal
+        self.integral_image = None                                 # Tabela de somas acumuladas (summed-area table)
+        self.color_lut = None                                      # Tabela de consulta BGR->FeO pré-calculada
+        self.color_lut_shift = 0                                   # Deslocamento da quantização da tabela
+        self.class_integrals = None                                # Contagens acumuladas de pixels por classe de FeO
+        self.class_integrals_lock = threading.Lock()               # Evita construções simultâneas das contagens
+        self.pyramid = None                                        # Pirâmide de cores médias pré-calculadas
+        self.palette = None                                        # Paleta densa amostrada da escala de cores
+        
+        # Cache LRU de resultados por caixa de pixels normalizada
+        self.result_cache = OrderedDict()                          # (nível, x1, y1, x2, y2) -> resultado
+        self.result_cache_size = result_cache_size                 # Quantidade máxima de resultados
+        self.result_cache_hits = 0                                 # Consultas respondidas pelo cache
+        self.result_cache_misses = 0                               # Consultas calculadas
+        self.result_cache_lock = threading.Lock()                  # Protege o cache entre threads
+        
+    def load_images(self):
+        """
+        Carrega e valida as imagens necessárias para a análise
+        Lança ImageLoadError com a mensagem de erro caso alguma validação falhe
+        """
+        clementine_path = self.clementine_path                     # Define caminho da imagem principal
+        scale_path = self.scale_path                               # Define caminho da escala
+        self.clear_result_cache()                                  # Resultados anteriores deixam de valer
+        
+        # Verificação de existência dos arquivos
+        if not os.path.exists(clementine_path):                    # Verifica se arquivo principal existe
+            raise ImageLoadError(f"Arquivo '{clementine_path}' não encontrado.")
+            
+        if not os.path.exists(scale_path):                         # Verifica se arquivo de escala existe
+            raise ImageLoadError(f"Arquivo '{scale_path}' não encontrado.")
+        
+        # Carregamento das imagens
+        if self.tiled:                                             # Mosaico acessado em blocos
+            try:
+                self.clementine_image = open_raster(clementine_path, cache_bytes=self.tile_cache_bytes)
+                self.clementine_image.stats = self.stats           # Conta blocos lidos e acertos do cache
+            except (OSError, ValueError) as e:                     # Falha ao abrir ou converter o mosaico
+                raise ImageLoadError(f"Falha ao carregar '{clementine_path}': {e}")
+        elif self.decoded_cache:                                   # Mosaico decodificado em cache no disco
+            try:
+                self.clementine_image = load_decoded(clementine_path)
+            except (OSError, ValueError) as e:                     # Falha ao decodificar ou mapear o mosaico
+                raise ImageLoadError(f"Falha ao carregar '{clementine_path}': {e}")
+        else:
+            import cv2                                             # Importação lenta, feita sob demanda
+            self.clementine_image = cv2.imread(clementine_path)    # Carrega imagem principal usando OpenCV
+        
+        # Validação de carregamento bem-sucedido
+        if self.clementine_image is None:                          # Verifica se imagem principal foi carregada
+            raise ImageLoadError(f"Falha ao carregar '{clementine_path}'. Verifique se é uma imagem válida.")
+        
+        # Verificação de dimensões mínimas
+        height, width = self.clementine_image.shape[:2]            # Obtém dimensões da imagem
+        if height < 10 or width < 10:                              # Verifica se dimensões são válidas
+            raise ImageLoadError("Imagem Clementine muito pequena para análise.")
+        
+        # Paleta densa da escala, lida do disco e refeita apenas quando a escala muda
+        if self.dense_palette:
+            self.load_palette()
+        
+        # Pré-cálculo da imagem integral para médias em tempo constante
+        # (no modo em blocos as médias somam apenas os blocos sobrepostos)
+        self.class_integrals = None                                # Construídas no primeiro uso
+        if self.precompute and not self.tiled:
+            if self.decoded_cache:                                 # Tabela gravada junto ao mosaico decodificado
+                self.integral_image = self.load_integral_image()
+            else:
+                self.integral_image = self.build_integral_image(self.clementine_image)
+        
+    def geographic_to_pixel(self, lat, lon, image_height, image_width):
+        """
+        Conversão de coordenadas geográficas para coordenadas de pixel
+        """
+        # Conversão latitude (Norte-Sul) para coordenada Y de pixel
+        pixel_y = int((90 - lat) * image_height / 180)             # Calcula coordenada Y
+        
+        # Conversão longitude (Oeste-Leste) para coordenada X de pixel  
+        pixel_x = int((lon + 180) * image_width / 360)             # Calcula coordenada X
+        
+        # Garante que as coordenadas estão dentro dos limites da imagem
+        pixel_x = max(0, min(pixel_x, image_width - 1))            # Limita X aos bounds da imagem
+        pixel_y = max(0, min(pixel_y, image_height - 1))           # Limita Y aos bounds da imagem
+        
+        return pixel_x, pixel_y                                    # Retorna coordenadas de pixel
+        
+    def build_integral_image(self, image, out=None):
+        """
+        Constrói a imagem integral (summed-area table) de cada canal da imagem
+        A tabela possui uma linha e uma coluna extras de zeros, de forma que
+        integral[y, x] é a soma de image[:y, :x] em cada canal
+        Se informado, out (int64, já com o formato da tabela) recebe o resultado
+        """
+        height, width = image.shape[:2]                            # Obtém altura e largura da imagem
+        channels = 1 if image.ndim == 2 else image.shape[2]        # Número de canais da imagem
+        
+        # Acumuladores de 64 bits evitam overflow mesmo em mosaicos enormes
+        if out is None:
+            integral = np.zeros((height + 1, width + 1, channels), dtype=np.int64)
+        else:
+            integral = out
+            integral[0] = 0                                        # Linha extra de zeros
+            integral[:, 0] = 0                                     # Coluna extra de zeros
+        pixels = image.reshape(height, width, channels)            # Garante formato (altura, largura, canais)
+        np.cumsum(pixels, axis=0, dtype=np.int64, out=integral[1:, 1:])  # Soma acumulada vertical
+        np.cumsum(integral[1:, 1:], axis=1, out=integral[1:, 1:])  # Soma acumulada horizontal
+        return integral                                            # Retorna tabela de somas
+        
+    def load_integral_image(self):
+        """
+        Retorna a tabela de somas da imagem principal mapeada em memória a partir do .npy
+        gravado ao lado da imagem, construindo-a direto em disco na primeira execução ou
+        quando a imagem de origem mudar (mesma assinatura do mosaico decodificado)
+        O arquivo é apenas um cache: se não puder ser gravado ou lido, a tabela é construída em memória
+        """
+        path = self.clementine_path + INTEGRAL_SUFFIX              # Arquivo auxiliar ao lado da imagem
+        temporary_path = path + ".tmp"                             # Grava em arquivo temporário
+        try:
+            if not sidecar_is_valid(self.clementine_path, path):   # Ausente ou desatualizado
+                height, width = self.clementine_image.shape[:2]
+                channels = 1 if self.clementine_image.ndim == 2 else self.clementine_image.shape[2]
+                table = np.lib.format.open_memmap(temporary_path, mode="w+", dtype=np.int64,
+                                                  shape=(height + 1, width + 1, channels))
+                self.build_integral_image(self.clementine_image, out=table)
+                table.flush()
+                del table
+                os.replace(temporary_path, path)                   # Publica o arquivo completo
+                write_signature(self.clementine_path, path)
+            return np.load(path, mmap_mode="r")
+        except OSError:                                            # Sem espaço ou sem permissão de escrita
+            discard_file(temporary_path)
+        return self.build_integral_image(self.clementine_image)    # Tabela apenas em memória
+        
+    def get_integral_sum(self, x1, y1, x2, y2):
+        """
+        Retorna a soma de cada canal no retângulo [y1:y2, x1:x2] usando a imagem integral
+        O custo é constante, independente do tamanho da área
+        """
+        integral = self.integral_image                             # Referência local à tabela de somas
+        return (integral[y2, x2] - integral[y1, x2]
+                - integral[y2, x1] + integral[y1, x1])             # Inclusão-exclusão dos quatro cantos
+        
+    def build_class_integrals(self, image):
+        """
+        Constrói uma tabela de contagens acumuladas para cada classe de FeO da escala
+        class_integrals[k, y, x] é a quantidade de pixels de image[:y, :x] na classe k
+        Os pixels são classificados pela tabela de consulta, em faixas de linhas
+        """
+        height, width = image.shape[:2]                            # Obtém altura e largura da imagem
+        if self.color_lut is None:                                 # Constrói a tabela sob demanda
+            self.build_color_lut()
+        class_lut = np.searchsorted(REFERENCE_FEO, self.color_lut).astype(np.uint8)  # BGR -> índice da classe
+        shift = self.color_lut_shift                               # Deslocamento da quantização
+        
+        # 32 bits sem sinal bastam enquanto a contagem de pixels couber no tipo
+        dtype = np.uint32 if height * width < 2 ** 32 else np.int64
+        integrals = np.zeros((len(REFERENCE_FEO), height + 1, width + 1), dtype=dtype)
+        rows = max(1, READ_CHUNK_PIXELS // width)                  # Linhas por faixa
+        for top in range(0, height, rows):                         # Contagem acumulada vertical por faixa
+            band = image[top:top + rows]
+            classes = class_lut[band[..., 0] >> shift, band[..., 1] >> shift, band[..., 2] >> shift]
+            for index in range(len(REFERENCE_FEO)):                # Para cada classe da escala
+                table = integrals[index, top + 1:top + 1 + len(band), 1:]  # Linhas da faixa na tabela
+                np.cumsum(classes == index, axis=0, dtype=dtype, out=table)
+                table += integrals[index, top, 1:]                 # Continua a soma da faixa anterior
+        for index in range(len(REFERENCE_FEO)):                    # Contagem acumulada horizontal
+            table = integrals[index, 1:, 1:]
+            np.cumsum(table, axis=1, out=table)
+        return integrals                                           # Retorna tabelas de contagem
+        
+    def get_class_integrals(self):
+        """
+        Tabelas de contagem por classe da imagem principal, construídas na primeira chamada
+        Retorna None no modo em blocos ou com precompute=False
+        """
+        if self.class_integrals is None and self.precompute and not self.tiled:
+            with self.class_integrals_lock:                        # Uma única construção entre threads
+                if self.class_integrals is None and self.clementine_image is not None:
+                    self.class_integrals = self.build_class_integrals(self.clementine_image)
+        return self.class_integrals
+        
+    def get_area_class_counts(self, image, x1, y1, x2, y2):
+        """
+        Conta os pixels de cada classe de FeO em uma área retangular da imagem
+        Retorna um vetor com uma contagem por cor de referência da escala
+        """
+        # Obtém dimensões da imagem e normaliza a região
+        height, width = image.shape[:2]                            # Obtém altura e largura da imagem
+        x1, y1, x2, y2 = self.normalize_pixel_box(x1, y1, x2, y2, height, width)  # Região válida e ordenada
+        
+        # Usa as contagens acumuladas quando disponíveis para a imagem principal
+        integrals = self.get_class_integrals() if image is self.clementine_image else None
+        if integrals is not None:
+            counts = (integrals[:, y2, x2].astype(np.int64) - integrals[:, y1, x2]
+                      - integrals[:, y2, x1] + integrals[:, y1, x1])  # Inclusão-exclusão por classe
+            return counts                                          # Contagens em tempo constante
+            
+        # Demais casos: classifica os pixels da região (bloco a bloco no mosaico em blocos)
+        if isinstance(image, TiledRaster):
+            windows = (window for window, _, _ in image.iter_tiles(x1, y1, x2, y2))
+        else:
+            windows = [image[y1:y2, x1:x2]]
+        counts = np.zeros(len(REFERENCE_FEO), dtype=np.int64)     # Contagem por classe
+        for window in windows:                                     # Para cada parte da região
+            classes = np.searchsorted(REFERENCE_FEO, self.classify_colors(window))
+            counts += np.bincount(classes.ravel(), minlength=len(REFERENCE_FEO))
+        return counts                                              # Retorna contagens por classe
+        
+    def normalize_pixel_box(self, x1, y1, x2, y2, height, width):
+        """
+        Limita a região aos bounds da imagem, ordena os cantos e garante ao menos um pixel
+        Retorna a região (x1, y1, x2, y2) efetivamente lida, com x2 e y2 exclusivos
+        """
+        # Garante que todas as coordenadas estão dentro dos limites válidos
+        x1 = max(0, min(x1, width-1))                              # Limita x1 aos bounds da imagem
+        x2 = max(0, min(x2, width-1))                              # Limita x2 aos bounds da imagem
+        y1 = max(0, min(y1, height-1))                             # Limita y1 aos bounds da imagem
+        y2 = max(0, min(y2, height-1))                             # Limita y2 aos bounds da imagem
+        
+        # Garante ordem correta das coordenadas
+        if x1 > x2:                                                # Se x1 maior que x2
+            x1, x2 = x2, x1                                        # Troca valores de x1 e x2
+        if y1 > y2:                                                # Se y1 maior que y2
+            y1, y2 = y2, y1                                        # Troca valores de y1 e y2
+            
+        # Verifica se a área é válida
+        if x2 - x1 < 1 or y2 - y1 < 1:                             # Se área muito pequena
+            x2 = x1 + 1                                            # Define x2 como x1 + 1
+            y2 = y1 + 1                                            # Define y2 como y1 + 1
+            
+        return x1, y1, x2, y2                                      # Retorna região normalizada
+        
+    def get_area_average_color(self, image, x1, y1, x2, y2, progress=None):
+        """
+        Extrai a cor média de uma área retangular da imagem
+        Se informado, progress(lidos, total) é chamado a cada parte lida da região e pode
+        lançar AnalysisCancelled para interromper a leitura
+        """
+        # Obtém dimensões da imagem e normaliza a região
+        height, width = image.shape[:2]                            # Obtém altura e largura da imagem
+        x1, y1, x2, y2 = self.normalize_pixel_box(x1, y1, x2, y2, height, width)  # Região válida e ordenada
+        area = (x2 - x1) * (y2 - y1)                               # Quantidade de pixels da região
+        self.stats.count("region_pixels", area)
+            
+        # Usa a imagem integral quando disponível para a imagem principal
+        if self.integral_image is not None and image is self.clementine_image:
+            return self.get_integral_sum(x1, y1, x2, y2) / area    # Média por canal em tempo constante
+        self.stats.count("pixels_read", area)                      # Pixels efetivamente somados
+            
+        # Mosaico em blocos: lê somente os blocos sobrepostos pela região
+        if isinstance(image, TiledRaster):
+            return image.region_sum(x1, y1, x2, y2, progress) / area  # Média por canal
+            
+        # Sem acompanhamento de progresso a região é lida de uma vez
+        if progress is None:
+            roi = image[y1:y2, x1:x2]                              # Corta área específica da imagem
+            average_color = np.mean(roi, axis=(0, 1))              # Calcula média nos eixos 0 e 1
+            return average_color                                   # Retorna cor média como array BGR
+            
+        # Com progresso, a região é somada em faixas de linhas
+        rows = max(1, READ_CHUNK_PIXELS // (x2 - x1))              # Linhas por faixa
+        total = np.zeros(image.shape[2], dtype=np.int64)           # Soma por canal
+        for top in range(y1, y2, rows):                            # Para cada faixa da região
+            total += image[top:min(top + rows, y2), x1:x2].sum(axis=(0, 1), dtype=np.int64)
+            progress(min(top + rows, y2) - y1, y2 - y1)            # Informa linhas já lidas
+        return total / area                                        # Retorna cor média como array BGR
+        
+    def compare_with_scale(self, target_color):
+        """
+        Compara a cor extraída com a escala de cores para determinar o percentual de FeO
+        Com a paleta densa carregada o percentual é fracionário
+        """
+        # Classifica a cor como um lote de um único elemento
+        colors = np.asarray(target_color, dtype=np.float64).reshape(1, 3)  # Converte cor BGR em lote (1, 3)
+        if self.palette is not None:                               # Busca exata na paleta densa
+            return float(self.palette.classify_colors(colors)[0])
+        return int(self.classify_colors(colors, use_lut=False)[0])  # Retorna percentual FeO
+        
+    def classify_colors(self, colors, use_lut=True):
+        """
+        Classifica um lote de cores BGR, no formato (N, 3) ou uma imagem (altura, largura, 3),
+        retornando o percentual de FeO de cada cor com o mesmo formato sem o eixo de canais
+        """
+        colors = np.asarray(colors)                                # Garante array NumPy
+        
+        # Cores inteiras de 8 bits podem ser resolvidas diretamente pela tabela de consulta
+        if use_lut and self.color_lut is not None and colors.dtype == np.uint8:
+            shift = self.color_lut_shift                           # Deslocamento da quantização
+            return self.color_lut[colors[..., 0] >> shift,
+                                  colors[..., 1] >> shift,
+                                  colors[..., 2] >> shift]         # Uma única operação de indexação
+            
+        # Caso geral: distância euclidiana por broadcasting, processada em blocos
+        flat = colors.reshape(-1, 3)                               # Achata em lista de cores BGR
+        result = np.empty(flat.shape[0], dtype=REFERENCE_FEO.dtype)  # Vetor de resultados
+        for start in range(0, flat.shape[0], CLASSIFY_CHUNK_SIZE): # Para cada bloco de cores
+            chunk = flat[start:start + CLASSIFY_CHUNK_SIZE, ::-1].astype(np.float64)  # Bloco convertido BGR->RGB
+            # |c - r|² = |c|² - 2c·r + |r|²; o termo |c|² não altera o mínimo
+            distances = REFERENCE_NORM - 2.0 * (chunk @ REFERENCE_RGB.T)  # Distâncias relativas (bloco, 11)
+            result[start:start + CLASSIFY_CHUNK_SIZE] = REFERENCE_FEO[np.argmin(distances, axis=1)]
+        return result.reshape(colors.shape[:-1])                   # Restaura formato original
+        
+    def build_color_lut(self, bits=8):
+        """
+        Pré-calcula a tabela de consulta BGR->FeO quantizada com 'bits' bits por canal
+        Com 8 bits a tabela é exata (256x256x256 entradas de 1 byte)
+        """
+        if not 1 <= bits <= 8:                                     # Verifica quantização válida
+            raise ValueError("Quantização da tabela deve estar entre 1 e 8 bits por canal")
+            
+        shift = 8 - bits                                           # Deslocamento aplicado a cada canal
+        levels = 1 << bits                                         # Níveis por canal
+        centers = (np.arange(levels, dtype=np.uint16) << shift) + ((1 << shift) >> 1)  # Centro de cada nível
+        
+        # Classifica uma fatia azul por vez para limitar o uso de memória
+        lut = np.empty((levels, levels, levels), dtype=np.uint8)   # Tabela indexada por [B, G, R]
+        green, red = np.meshgrid(centers, centers, indexing="ij")  # Grade dos canais verde e vermelho
+        for b_index, blue in enumerate(centers):                   # Para cada nível de azul
+            plane = np.stack([np.full_like(green, blue), green, red], axis=-1)  # Plano de cores BGR
+            lut[b_index] = self.classify_colors(plane, use_lut=False)  # Classifica o plano inteiro
+            
+        self.color_lut = lut                                       # Armazena tabela de consulta
+        self.color_lut_shift = shift                               # Armazena deslocamento da quantização
+        return lut                                                 # Retorna tabela
+        
+    def classify_image(self, image=None):
+        """
+        Classifica todos os pixels de uma imagem BGR (por padrão a imagem Clementine)
+        retornando um mapa de FeO com as mesmas dimensões
+        Com a paleta densa carregada o mapa é fracionário (float32)
+        """
+        if image is None:                                          # Usa imagem principal por padrão
+            image = self.clementine_image
+        if isinstance(image, TiledRaster):                         # Monta o mosaico a partir dos blocos
+            height, width = image.shape[:2]
+            image = image.read_window(0, 0, width, height)
+        if self.palette is not None:                               # Tabela de consulta da paleta densa
+            return self.palette.classify_colors(image)
+        if self.color_lut is None:                                 # Constrói a tabela sob demanda
+            self.build_color_lut()
+        return self.classify_colors(image)                         # Classificação por indexação
+        
+    def determine_associated_element(self, feo_percentage):
+        """
+        Determina o elemento associado baseado na concentração de FeO
+        """
+        if feo_percentage < 8.6:                                   # Se FeO menor que 8.6%
+            return "Al (Alumínio) e Pode conter argila"  # Retorna Alumínio
+        elif 8.6 <= feo_percentage <= 15.9:                       # Se FeO entre 8.6% e 15.9%
+            return "Si (Silício)"   # Retorna Silício
+        else:                                                      # Se FeO maior que 15.9%
+            return "Ti (Titânio) e Pode conter argila"                             # Retorna Titânio
+            
+    def validate_input_values(self, max_ns, min_ns, max_ol, min_ol):
+        """
+        Valida os valores de entrada fornecidos pelo usuário
+        """
+        # Validação dos intervalos Norte-Sul
+        if not (-90 <= min_ns <= max_ns <= 90):                    # Verifica se valores NS estão corretos
+            raise ValueError("Valores Norte-Sul devem estar entre -90 e 90, com mínimo ≤ máximo")
+            
+        # Validação dos intervalos Oeste-Leste  
+        if not (-180 <= min_ol <= max_ol <= 180):                  # Verifica se valores OL estão corretos
+            raise ValueError("Valores Oeste-Leste devem estar entre -180 e 180, com mínimo ≤ máximo")
+            
+        # Validação de área mínima
+        ns_range = max_ns - min_ns                                 # Calcula amplitude Norte-Sul
+        ol_range = max_ol - min_ol                                 # Calcula amplitude Oeste-Leste
+        
+        if ns_range < 1 or ol_range < 1:                           # Se área muito pequena
+            raise ValueError("Área selecionada muito pequena. Mínimo 1 grau em cada direção.")
+            
+    def analyze_region_distribution(self, max_ns, min_ns, max_ol, min_ol):
+        """
+        Distribuição das classes de FeO dentro de uma região geográfica
+        Retorna um dicionário com a fração de pixels de cada classe, o FeO médio ponderado
+        pela área, a fração de cada elemento associado e a caixa de pixels
+        """
+        # Validação dos valores
+        self.validate_input_values(max_ns, min_ns, max_ol, min_ol)  # Lança ValueError se inválidos
+        
+        # Conversão de coordenadas geográficas para pixels
+        height, width = self.clementine_image.shape[:2]            # Obtém altura e largura
+        x1, y1 = self.geographic_to_pixel(max_ns, min_ol, height, width)  # Canto superior esquerdo
+        x2, y2 = self.geographic_to_pixel(min_ns, max_ol, height, width)  # Canto inferior direito
+        
+        # Frações de cada classe de FeO na região
+        counts = self.get_area_class_counts(self.clementine_image, x1, y1, x2, y2)  # Pixels por classe
+        fractions = counts / counts.sum()                          # Fração de pixels por classe
+        
+        # Agrupamento das frações pelo elemento associado a cada classe
+        element_fractions = {}                                     # Fração de pixels por elemento
+        for feo_value, fraction in zip(REFERENCE_FEO.tolist(), fractions.tolist()):
+            element = self.determine_associated_element(feo_value)  # Elemento da classe
+            element_fractions[element] = element_fractions.get(element, 0.0) + fraction
+            
+        return {
+            "feo_fractions": dict(zip(REFERENCE_FEO.tolist(), fractions.tolist())),  # FeO -> fração
+            "mean_feo": float(np.dot(fractions, REFERENCE_FEO)),   # FeO médio ponderado pela área
+            "element_fractions": element_fractions,                # Elemento -> fração
+            "pixel_box": (x1, y1, x2, y2),                         # Coordenadas de pixel
+        }
+        
+    def load_palette(self, lut=True):
+        """
+        Carrega a paleta densa gravada ao lado da escala, construindo-a a partir da barra
+        de cores se estiver ausente ou se a escala tiver mudado
+        Com lut=False a tabela de consulta não é carregada e as cores usam a busca exata
+        """
+        try:
+            self.palette = DensePalette.load_or_build(self.scale_path, REFERENCE_RGB[0],
+                                                      (REFERENCE_FEO[0], REFERENCE_FEO[-1]), lut=lut)
+        except (OSError, ValueError) as e:                         # Escala ilegível ou sem barra de cores
+            raise ImageLoadError(f"Falha ao ler a escala '{self.scale_path}': {e}")
+        self.clear_result_cache()                                  # Resultados inteiros deixam de valer
+        return self.palette
+        
+    def load_pyramid(self, build=True):
+        """
+        Carrega a pirâmide de cores médias gravada ao lado do mosaico, construindo-a
+        se estiver ausente ou desatualizada (e build for True)
+        Retorna True se a pirâmide estiver disponível
+        """
+        self.pyramid = FeOPyramid.load(self.clementine_path)       # Pirâmide gravada e válida
+        if self.pyramid is None and build:                         # Ausente ou desatualizada
+            self.pyramid = FeOPyramid.build(self)
+        return self.pyramid is not None
+        
+    def analyze_region(self, max_ns, min_ns, max_ol, min_ol, tolerance=0, progress=None):
+        """
+        Executa a análise completa de uma região geográfica já carregada em memória
+        Retorna um dicionário com FeO, elemento associado, cor média (BGR), caixa de pixels
+        e nível da pirâmide utilizado (0 para a resolução original)
+        Com tolerance > 0 e a pirâmide carregada, as bordas da região podem ser ajustadas
+        em até 'tolerance' pixels para responder a partir de um nível mais grosso; com a tabela
+        de somas a resposta exata já é O(1), e a pirâmide só é usada sem ela (modo em blocos)
+        progress é repassado para get_area_average_color
+        Com a instrumentação ativa, a consulta é registrada em self.stats
+        """
+        if not self.stats.enabled:                                 # Caminho sem medição
+            return self.compute_region(max_ns, min_ns, max_ol, min_ol, tolerance, progress)
+        with self.stats.query(region=[max_ns, min_ns, max_ol, min_ol], tolerance=tolerance) as record:
+            result = self.compute_region(max_ns, min_ns, max_ol, min_ol, tolerance, progress)
+            record.update(feo=result["feo"], level=result["level"], pixel_box=list(result["pixel_box"]))
+            return result
+            
+    def compute_region(self, max_ns, min_ns, max_ol, min_ol, tolerance=0, progress=None):
+        """
+        Etapas da análise de uma região (validação, coordenadas, cache, média e classificação),
+        cada uma medida em self.stats
+        """
+        stats = self.stats
+        
+        # Validação dos valores
+        with stats.stage("validate"):
+            self.validate_input_values(max_ns, min_ns, max_ol, min_ol)  # Lança ValueError se inválidos
+        
+        # Obtenção das dimensões da imagem
+        height, width = self.clementine_image.shape[:2]            # Obtém altura e largura
+        
+        with stats.stage("coordinates"):
+            # Conversão de coordenadas geográficas para pixels
+            x1, y1 = self.geographic_to_pixel(max_ns, min_ol, height, width)  # Canto superior esquerdo
+            x2, y2 = self.geographic_to_pixel(min_ns, max_ol, height, width)  # Canto inferior direito
+            
+            # Escolha do nível da pirâmide permitido pela tolerância, apenas sem a tabela de somas
+            level = 0
+            if self.pyramid is not None and self.integral_image is None:
+                level = self.pyramid.select_level(tolerance)
+            
+            # Regiões geográficas diferentes que resultam nos mesmos pixels compartilham o resultado
+            box = self.normalize_pixel_box(x1, y1, x2, y2, height, width)  # Região efetivamente lida
+        key = (level,) + box                                       # Chave do cache de resultados
+        cached = self.get_cached_result(key)
+        if cached is None:
+            # Extração da cor média (leitura e soma dos pixels são feitas na mesma passada)
+            with stats.stage("average"):
+                if level > 0:                                      # Resposta a partir da pirâmide
+                    average_color, pyramid_box = self.pyramid.query(*box, level)
+                else:
+                    average_color = self.get_area_average_color(self.clementine_image, x1, y1, x2, y2,
+                                                                progress)  # Cor média
+                    pyramid_box = None
+            # Percentual de FeO e elemento associado
+            with stats.stage("classify"):
+                feo_percentage = self.compare_with_scale(average_color)  # % FeO baseado na cor
+                associated_element = self.determine_associated_element(feo_percentage)  # Elemento químico
+            cached = {"feo": feo_percentage, "element": associated_element,
+                      "color": average_color, "pyramid_box": pyramid_box}
+            self.store_cached_result(key, cached)
+        
+        return {
+            "feo": cached["feo"],                                  # Percentual de FeO
+            "element": cached["element"],                          # Elemento associado
+            "color": cached["color"].copy(),                       # Cor média BGR
+            "pixel_box": cached["pyramid_box"] or (x1, y1, x2, y2),  # Coordenadas de pixel
+            "level": level,                                        # Nível da pirâmide utilizado
+        }
+        
+    def get_cached_result(self, key):
+        """
+        Retorna o resultado em cache para a chave, ou None, atualizando os contadores
+        """
+        with self.result_cache_lock:
+            cached = self.result_cache.get(key)
+            if cached is None:                                     # Região ainda não analisada
+                self.result_cache_misses += 1
+            else:
+                self.result_cache.move_to_end(key)                 # Marca como usada recentemente
+                self.result_cache_hits += 1
+        self.stats.count("result_cache_misses" if cached is None else "result_cache_hits")
+        return cached
+            
+    def store_cached_result(self, key, result):
+        """
+        Guarda um resultado no cache, descartando os menos usados acima da capacidade
+        """
+        if self.result_cache_size <= 0:                            # Cache desativado
+            return
+        with self.result_cache_lock:
+            self.result_cache[key] = result
+            self.result_cache.move_to_end(key)
+            while len(self.result_cache) > self.result_cache_size:
+                self.result_cache.popitem(last=False)
+                
+    def clear_result_cache(self):
+        """
+        Esvazia o cache de resultados e zera os contadores
+        """
+        with self.result_cache_lock:
+            self.result_cache.clear()
+            self.result_cache_hits = 0
+            self.result_cache_misses = 0
+            
+    def result_cache_stats(self):
+        """
+        Estatísticas do cache de resultados: acertos, falhas, tamanho atual e capacidade
+        """
+        with self.result_cache_lock:
+            return {"hits": self.result_cache_hits, "misses": self.result_cache_misses,
+                    "size": len(self.result_cache), "capacity": self.result_cache_size}
@@ -0,0 +1,226 @@
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+from lunar_raster import SIGNATURE_SUFFIX, sidecar_is_valid, source_signature
+
+
+PALETTE_SUFFIX = ".palette.npz"                                    # Paleta gravada ao lado da escala
+DEFAULT_SAMPLES = 256                                              # Cores amostradas ao longo da barra
+LUT_BITS = 8                                                       # Bits por canal da tabela de consulta (8 = exata)
+SATURATION_THRESHOLD = 60                                          # Diferença mínima entre canais da barra
+BAR_FRACTION = 0.5                                                 # Fração do máximo que delimita a barra
+EDGE_TRIM = 0.2                                                    # Fração da espessura descartada em cada borda
+CLASSIFY_CHUNK_SIZE = 1 << 16                                      # Cores por bloco na busca exata
+
+
+def find_color_bar(image):
+    """
+    Localiza a barra de cores na imagem da escala (BGR) pelos pixels saturados, ignorando
+    fundo, bordas e textos em branco, preto ou cinza
+    Retorna a caixa (x1, y1, x2, y2) da barra e se ela é horizontal
+    """
+    pixels = image.astype(np.int16)
+    mask = pixels.max(axis=2) - pixels.min(axis=2) >= SATURATION_THRESHOLD  # Pixels coloridos
+    if not mask.any():
+        raise ValueError("Nenhuma barra de cores encontrada na imagem da escala")
+
+    rows = np.flatnonzero(mask.mean(axis=1) >= BAR_FRACTION * mask.mean(axis=1).max())  # Linhas da barra
+    cols = np.flatnonzero(mask.mean(axis=0) >= BAR_FRACTION * mask.mean(axis=0).max())  # Colunas da barra
+    x1, y1, x2, y2 = cols[0], rows[0], cols[-1] + 1, rows[-1] + 1
+    return (int(x1), int(y1), int(x2), int(y2)), (x2 - x1) >= (y2 - y1)
+
+
+def sample_color_bar(image, samples=DEFAULT_SAMPLES):
+    """
+    Amostra 'samples' cores RGB igualmente espaçadas ao longo da barra de cores
+    Cada posição usa a mediana da faixa central da espessura da barra
+    """
+    (x1, y1, x2, y2), horizontal = find_color_bar(image)
+    bar = image[y1:y2, x1:x2, ::-1].astype(np.float64)             # Barra em RGB
+    if not horizontal:
+        bar = bar.transpose(1, 0, 2)                               # Eixo da barra na horizontal
+    thickness = bar.shape[0]
+    trim = int(thickness * EDGE_TRIM)
+    profile = np.median(bar[trim:thickness - trim or None], axis=0)  # Cor ao longo da barra (comprimento, 3)
+
+    positions = np.linspace(0, len(profile) - 1, samples)          # Posições amostradas
+    return np.stack([np.interp(positions, np.arange(len(profile)), profile[:, channel])
+                     for channel in range(3)], axis=1)
+
+
+class DensePalette:
+    """
+    Paleta contínua amostrada da barra de cores da escala, com valores fracionários de FeO
+    A cor mais próxima de um pixel de 8 bits é obtida por uma tabela de consulta com o índice
+    da paleta; cores em ponto flutuante usam busca exata
+    Com LUT_BITS = 8 a tabela (16 MB com até 256 cores) coincide com a busca exata; com menos bits ela é
+    quantizada e pode divergir da busca exata em cores próximas da fronteira entre amostras
+    Sem a tabela (lut None) todas as cores usam a busca exata
+    """
+    def __init__(self, colors, feo, lut, shift):
+        self.colors = colors                                       # Cores RGB da paleta (N, 3)
+        self.feo = feo                                             # FeO de cada cor (N,) float32
+        self.norms = np.sum(colors ** 2, axis=1)                   # Norma ao quadrado de cada cor
+        self.weights = -2.0 * colors.T                             # Pesos de cada canal (3, N)
+        self.lut = lut                                             # Índice da paleta por [B, G, R] quantizado
+        self.shift = shift                                         # Deslocamento da quantização
+
+    @staticmethod
+    def index_dtype(samples):
+        """
+        Menor tipo inteiro capaz de guardar o índice de uma paleta com 'samples' cores
+        """
+        return np.uint8 if samples <= 256 else np.uint16
+
+    @staticmethod
+    def default_path(scale_path):
+        """
+        Caminho padrão da paleta gravada, ao lado da imagem da escala
+        """
+        return scale_path + PALETTE_SUFFIX
+
+    @classmethod
+    def build(cls, scale_path, low_color, feo_range, samples=DEFAULT_SAMPLES, bits=LUT_BITS):
+        """
+        Lê a imagem da escala e constrói a paleta densa
+        low_color é a cor RGB do menor FeO (define o sentido da barra) e feo_range o intervalo
+        (mínimo, máximo) de FeO coberto pela barra, distribuído linearmente ao longo dela
+        """
+        import cv2                                                 # Importação lenta, feita sob demanda
+
+        image = cv2.imread(scale_path)
+        if image is None:
+            raise ValueError(f"Falha ao carregar a escala '{scale_path}'")
+        colors = sample_color_bar(image, samples)
+        low_color = np.asarray(low_color, dtype=np.float64)
+        if np.sum((colors[-1] - low_color) ** 2) < np.sum((colors[0] - low_color) ** 2):
+            colors = colors[::-1]                                  # Barra desenhada do maior para o menor FeO
+        feo = np.linspace(feo_range[0], feo_range[1], samples, dtype=np.float32)
+        lut, shift = cls.build_lut(colors, bits)
+        return cls(colors, feo, lut, shift)
+
+    @staticmethod
+    def build_lut(colors, bits):
+        """
+        Tabela [B, G, R] quantizada com o índice da cor mais próxima da paleta
+        As distâncias seguem a mesma ordem de operações de distances(), usada pela busca exata,
+        para que as duas escolham a mesma cor inclusive em empates
+        """
+        shift = 8 - bits                                           # Deslocamento aplicado a cada canal
+        levels = 1 << bits                                         # Níveis por canal
+        centers = ((np.arange(levels) << shift) + ((1 << shift) >> 1)).astype(np.float64)  # Centro de cada nível
+        norms = np.sum(colors ** 2, axis=1)                        # Norma ao quadrado de cada cor
+        weights = -2.0 * colors.T                                  # |c - p|² = |c|² - 2p·c, sem o termo |p|²
+
+        # Parcela de vermelho e verde calculada uma única vez; cada fatia azul soma apenas o azul
+        lut = np.empty((levels, levels, levels), dtype=DensePalette.index_dtype(len(colors)))
+        green, red = np.meshgrid(centers, centers, indexing="ij")
+        base = norms + red.reshape(-1, 1) * weights[0] + green.reshape(-1, 1) * weights[1]
+        distances = np.empty_like(base)                            # Reaproveitado em cada fatia
+        for b_index, blue in enumerate(centers):                   # Para cada nível de azul
+            np.add(base, blue * weights[2], out=distances)
+            lut[b_index] = np.argmin(distances, axis=1).reshape(levels, levels)
+        return lut, shift
+
+    def save(self, path, scale_path):
+        """
+        Grava a paleta e a assinatura da escala de origem usada para validá-la
+        """
+        temporary_path = path + ".tmp"
+        with open(temporary_path, "wb") as handle:                 # Evita que np.savez acrescente a extensão
+            np.savez(handle, colors=self.colors, feo=self.feo, lut=self.lut, shift=self.shift)
+        os.replace(temporary_path, path)                           # Publica o arquivo completo
+        with open(path + SIGNATURE_SUFFIX, "w") as handle:         # Assinatura da escala de origem
+            json.dump(source_signature(scale_path), handle)
+
+    @classmethod
+    def load(cls, scale_path, samples=DEFAULT_SAMPLES, bits=LUT_BITS, path=None, lut=True):
+        """
+        Carrega a paleta gravada; retorna None se ela não existir, se a escala tiver mudado
+        ou se tiver sido gerada com outra quantidade de amostras ou de bits
+        Com lut=False apenas as cores e o FeO são lidos, sem a tabela de consulta
+        """
+        path = path or cls.default_path(scale_path)
+        if not sidecar_is_valid(scale_path, path):                 # Ausente ou escala alterada
+            return None
+        with np.load(path) as data:                                # Cada array é lido apenas se acessado
+            colors, feo, shift = data["colors"], data["feo"], int(data["shift"])
+            lut = data["lut"] if lut else None
+        if len(colors) != samples or shift != 8 - bits:            # Parâmetros diferentes
+            return None
+        if lut is not None:                                        # Paletas gravadas com índice uint16
+            lut = lut.astype(cls.index_dtype(samples), copy=False)
+        return cls(colors, feo, lut, shift)
+
+    @classmethod
+    def load_or_build(cls, scale_path, low_color, feo_range, samples=DEFAULT_SAMPLES, bits=LUT_BITS, lut=True):
+        """
+        Paleta gravada ao lado da escala, reconstruída apenas quando a escala muda
+        """
+        palette = cls.load(scale_path, samples, bits, lut=lut)
+        if palette is None:
+            palette = cls.build(scale_path, low_color, feo_range, samples, bits)
+            palette.save(cls.default_path(scale_path), scale_path)
+        return palette
+
+    def distances(self, rgb):
+        """
+        Distâncias relativas (|c - p|² sem o termo |p|²) de cada cor RGB (N, 3) às cores da paleta
+        """
+        base = self.norms + rgb[:, 0:1] * self.weights[0] + rgb[:, 1:2] * self.weights[1]  # Vermelho e verde
+        return base + rgb[:, 2:3] * self.weights[2]                # Azul somado por último, como na tabela
+
+    def classify_colors(self, colors):
+        """
+        FeO fracionário (float32) de um lote de cores BGR, no formato (N, 3) ou (altura, largura, 3)
+        Cores de 8 bits usam a tabela de consulta; as demais, a busca exata na paleta
+        """
+        colors = np.asarray(colors)
+        if colors.dtype == np.uint8 and self.lut is not None:      # Índice da paleta pela tabela de consulta
+            shift = self.shift
+            if shift:
+                colors = colors >> shift
+            return self.feo[self.lut[colors[..., 0], colors[..., 1], colors[..., 2]]]
+
+        flat = colors.reshape(-1, 3)
+        result = np.empty(flat.shape[0], dtype=np.float32)
+        for start in range(0, flat.shape[0], CLASSIFY_CHUNK_SIZE):  # Para cada bloco de cores
+            chunk = flat[start:start + CLASSIFY_CHUNK_SIZE, ::-1].astype(np.float64)  # BGR->RGB
+            result[start:start + CLASSIFY_CHUNK_SIZE] = self.feo[np.argmin(self.distances(chunk), axis=1)]
+        return result.reshape(colors.shape[:-1])
+
+
+def main(argv=None):
+    """
+    Gera (ou valida) a paleta densa gravada ao lado da escala de cores
+    """
+    from lunar_core import REFERENCE_FEO, REFERENCE_RGB
+
+    parser = argparse.ArgumentParser(description="Gera a paleta densa de FeO a partir da barra da escala de cores")
+    parser.add_argument("scale", nargs="?", default="escala-clementine.jpeg", help="caminho da escala de cores")
+    parser.add_argument("--samples", type=int, default=DEFAULT_SAMPLES, help="cores amostradas ao longo da barra")
+    parser.add_argument("--bits", type=int, choices=range(1, 9), default=LUT_BITS, help="bits por canal da tabela de consulta")
+    parser.add_argument("--force", action="store_true", help="reconstrói mesmo se a paleta estiver válida")
+    args = parser.parse_args(argv)
+
+    if not args.force and DensePalette.load(args.scale, args.samples, args.bits) is not None:
+        print("Paleta já está atualizada.")
+        return 0
+    try:
+        palette = DensePalette.build(args.scale, REFERENCE_RGB[0], (REFERENCE_FEO[0], REFERENCE_FEO[-1]),
+                                     args.samples, args.bits)
+    except ValueError as e:
+        print(f"Erro: {e}", file=sys.stderr)
+        return 1
+    path = DensePalette.default_path(args.scale)
+    palette.save(path, args.scale)
+    print(f"Paleta com {len(palette.colors)} cores gravada em '{path}'.")
+    return 0
+
+
+if __name__ == "__main__":                                         # Execução direta
+    sys.exit(main())                                               # Chama função principal
@@ -0,0 +1,209 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+
+import numpy as np
+
+from lunar_raster import signature_matches, source_signature
+
+
+PYRAMID_SUFFIX = ".pyramid"                                        # Diretório da pirâmide ao lado da imagem
+META_FILE = "meta.json"                                            # Metadados de validação da pirâmide
+BAND_BYTES = 64 * 1024 * 1024                                      # Memória de trabalho por faixa de linhas
+
+
+def cell_counts(length, scale):
+    """
+    Quantidade de pixels originais cobertos por cada célula de um eixo em uma escala
+    (as células da borda podem cobrir menos pixels)
+    """
+    cells = -(-length // scale)                                    # Número de células no eixo
+    return np.minimum(scale, length - np.arange(cells) * scale)
+
+
+def band_rows(width):
+    """
+    Número par de linhas por faixa que respeita o orçamento de memória de trabalho
+    """
+    rows = BAND_BYTES // max(1, width * 3 * 8)                     # Linhas de float64 com 3 canais
+    return max(2, rows - rows % 2)
+
+
+def read_source_rows(image):
+    """
+    Retorna uma função que lê faixas de linhas da imagem original (array ou mosaico em blocos)
+    """
+    width = image.shape[1]
+    if hasattr(image, "read_window"):                              # Mosaico em blocos
+        return lambda top, bottom: image.read_window(0, top, width, bottom)
+    return lambda top, bottom: image[top:bottom]
+
+
+class FeOPyramid:
+    """
+    Pirâmide de rasters de cor média em reduções sucessivas de 2x
+    O nível k cobre blocos de 2^k x 2^k pixels da imagem original
+    """
+    def __init__(self, directory, meta, colors):
+        self.directory = directory                                 # Diretório da pirâmide
+        self.meta = meta                                           # Metadados (origem e dimensões)
+        self.height = meta["height"]                               # Altura da imagem original
+        self.width = meta["width"]                                 # Largura da imagem original
+        self.colors = colors                                       # {nível: cor média BGR float32}
+        self.levels = sorted(colors)                               # Níveis disponíveis (1, 2, ...)
+
+    @staticmethod
+    def default_directory(source_path):
+        """
+        Diretório padrão da pirâmide, ao lado da imagem de origem
+        """
+        return source_path + PYRAMID_SUFFIX
+
+    @classmethod
+    def build(cls, core, directory=None):
+        """
+        Constrói e grava a pirâmide completa a partir do mosaico carregado no núcleo de análise
+        """
+        source_path = core.clementine_path                         # Imagem de origem
+        directory = directory or cls.default_directory(source_path)
+        if os.path.isdir(directory):                               # Descarta uma pirâmide anterior
+            shutil.rmtree(directory)
+        os.makedirs(directory)
+
+        height, width = core.clementine_image.shape[:2]            # Dimensões da imagem original
+        read_rows = read_source_rows(core.clementine_image)        # Leitura do nível 0
+        level_h, level_w, scale = height, width, 1                 # Dimensões do nível anterior
+        colors = {}
+        level = 0
+        while level_h > 1 or level_w > 1:                          # Reduz até restar uma única célula
+            level += 1
+            color = cls.build_level(read_rows, height, width, level_h, level_w, scale,
+                                    os.path.join(directory, f"color_{level}.npy"))
+            colors[level] = color
+            level_h, level_w = color.shape[:2]
+            scale *= 2
+            read_rows = lambda top, bottom, color=color: color[top:bottom]
+
+        meta = dict(source_signature(source_path), height=height, width=width, levels=level)
+        with open(os.path.join(directory, META_FILE), "w") as handle:
+            json.dump(meta, handle)
+        return cls(directory, meta, colors)
+
+    @staticmethod
+    def build_level(read_rows, height, width, level_h, level_w, scale, path):
+        """
+        Gera o nível seguinte calculando a média ponderada de cada bloco 2x2 do nível anterior
+        Os pesos são as quantidades de pixels originais de cada célula, o que mantém as bordas exatas
+        """
+        row_weights = cell_counts(height, scale).astype(np.float64)  # Pixels por linha de células
+        col_weights = cell_counts(width, scale).astype(np.float64)   # Pixels por coluna de células
+        out_h, out_w = -(-level_h // 2), -(-level_w // 2)          # Dimensões do novo nível
+        output = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(out_h, out_w, 3))
+
+        step = band_rows(level_w)                                  # Linhas (pares) por faixa
+        for top in range(0, level_h, step):
+            bottom = min(top + step, level_h)
+            weights = np.zeros((step, out_w * 2))                  # Pesos com preenchimento nulo
+            weights[:bottom - top, :level_w] = np.outer(row_weights[top:bottom], col_weights)
+            band = np.zeros((step, out_w * 2, 3))                  # Faixa com preenchimento nulo
+            band[:bottom - top, :level_w] = read_rows(top, bottom)
+            band *= weights[:, :, None]                            # Converte médias em somas
+
+            rows = -(-(bottom - top) // 2)                         # Linhas do novo nível nesta faixa
+            sums = band[:rows * 2].reshape(rows, 2, out_w, 2, 3).sum(axis=(1, 3))
+            totals = weights[:rows * 2].reshape(rows, 2, out_w, 2).sum(axis=(1, 3))
+            output[top // 2:top // 2 + rows] = sums / totals[:, :, None]
+        output.flush()
+        return output
+
+    @classmethod
+    def load(cls, source_path, directory=None):
+        """
+        Carrega uma pirâmide gravada, mapeada em memória
+        Retorna None se ela não existir ou se a imagem de origem tiver mudado
+        """
+        directory = directory or cls.default_directory(source_path)
+        meta_path = os.path.join(directory, META_FILE)
+        if not os.path.exists(meta_path) or not os.path.exists(source_path):
+            return None
+        with open(meta_path) as handle:
+            meta = json.load(handle)
+
+        if not signature_matches(source_path, meta):               # Imagem de origem mudou
+            return None
+        mtime = os.stat(source_path).st_mtime
+        if meta["source_mtime"] != mtime:                          # Mesmo conteúdo com nova data
+            meta["source_mtime"] = mtime                           # Evita recalcular o hash na próxima vez
+            with open(meta_path, "w") as handle:
+                json.dump(meta, handle)
+
+        colors = {}
+        for level in range(1, meta["levels"] + 1):                 # Mapeia cada nível em memória
+            colors[level] = np.load(os.path.join(directory, f"color_{level}.npy"), mmap_mode="r")
+        return cls(directory, meta, colors)
+
+    def select_level(self, tolerance):
+        """
+        Escolhe o nível mais grosso cujo arredondamento das bordas (2^(k-1) pixels)
+        não ultrapassa a tolerância em pixels; 0 significa resolução original
+        """
+        level = 0
+        for candidate in self.levels:
+            if 2 ** (candidate - 1) <= tolerance:
+                level = candidate
+        return level
+
+    def query(self, x1, y1, x2, y2, level):
+        """
+        Cor média BGR da região [y1:y2, x1:x2] aproximada no nível indicado
+        Retorna a cor e a caixa de pixels efetivamente coberta na imagem original
+        O custo é proporcional ao número de células cobertas (4^k vezes menor que no nível 0)
+        """
+        scale = 2 ** level                                         # Pixels originais por célula
+        color = self.colors[level]
+        cells_h, cells_w = color.shape[:2]
+
+        # Ajusta as bordas à grade do nível, garantindo ao menos uma célula
+        cx1 = min(int(round(x1 / scale)), cells_w - 1)
+        cy1 = min(int(round(y1 / scale)), cells_h - 1)
+        cx2 = max(min(int(round(x2 / scale)), cells_w), cx1 + 1)
+        cy2 = max(min(int(round(y2 / scale)), cells_h), cy1 + 1)
+
+        weights = np.outer(cell_counts(self.height, scale)[cy1:cy2],
+                           cell_counts(self.width, scale)[cx1:cx2])  # Pixels originais por célula
+        sums = np.tensordot(weights, color[cy1:cy2, cx1:cx2], axes=([0, 1], [0, 1]))
+        box = (cx1 * scale, cy1 * scale, min(cx2 * scale, self.width), min(cy2 * scale, self.height))
+        return sums / weights.sum(), box
+
+
+def main(argv=None):
+    """
+    Etapa offline: constrói a pirâmide de FeO ao lado do mosaico
+    """
+    from lunar_core import LunarFeOCore, ImageLoadError
+
+    parser = argparse.ArgumentParser(description="Constrói a pirâmide de cores médias de um mosaico Clementine")
+    parser.add_argument("image", nargs="?", default="clementine.tif", help="caminho da imagem Clementine")
+    parser.add_argument("--scale", default="escala-clementine.jpeg", help="caminho da escala de cores")
+    parser.add_argument("--tiled", action="store_true", help="lê o mosaico em blocos sob demanda")
+    parser.add_argument("--force", action="store_true", help="reconstrói mesmo se a pirâmide estiver válida")
+    args = parser.parse_args(argv)
+
+    if not args.force and FeOPyramid.load(args.image) is not None:
+        print("Pirâmide já está atualizada.")
+        return 0
+    core = LunarFeOCore(args.image, args.scale, tiled=args.tiled)
+    try:
+        core.load_images()
+    except ImageLoadError as e:
+        print(f"Erro: {e}", file=sys.stderr)
+        return 1
+    pyramid = FeOPyramid.build(core)
+    print(f"Pirâmide com {len(pyramid.levels)} níveis gravada em '{pyramid.directory}'.")
+    return 0
+
+
+if __name__ == "__main__":                                         # Execução direta
+    sys.exit(main())                                               # Chama função principal
@@ -0,0 +1,392 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from lunar_stats import DISABLED_STATS
+
+
+DEFAULT_TILE_SIZE = 512                                            # Lado dos blocos de fontes não blocadas
+DEFAULT_CACHE_BYTES = 256 * 1024 * 1024                            # Orçamento padrão do cache de blocos
+SIDECAR_SUFFIX = ".npy"                                            # Extensão do arquivo auxiliar mapeado em memória
+COPY_ROWS = 1024                                                   # Linhas copiadas por vez na conversão
+SIGNATURE_SUFFIX = ".json"                                         # Assinatura da origem gravada junto ao .npy
+HASH_CHUNK = 8 * 1024 * 1024                                       # Bytes lidos por vez no cálculo do hash
+
+
+class ArraySource:
+    """
+    Fonte de pixels baseada em um array BGR, em memória ou mapeado (np.memmap)
+    """
+    def __init__(self, array, tile_size=DEFAULT_TILE_SIZE):
+        self.array = array                                         # Array (altura, largura, 3) em BGR
+        self.shape = array.shape                                   # Dimensões da imagem
+        self.tile_shape = (tile_size, tile_size)                   # Dimensões de cada bloco
+
+    def read_tile(self, tile_y, tile_x):
+        """
+        Lê o bloco (tile_y, tile_x), copiando apenas os pixels desse bloco
+        """
+        tile_h, tile_w = self.tile_shape
+        return np.array(self.array[tile_y * tile_h:(tile_y + 1) * tile_h,
+                                   tile_x * tile_w:(tile_x + 1) * tile_w])
+
+    def close(self):
+        """
+        Libera o mapeamento do array
+        """
+        self.array = None
+
+
+class TiffTileSource:
+    """
+    Fonte de pixels que decodifica blocos nativos de um TIFF blocado, um por vez
+    """
+    def __init__(self, path):
+        self.tiff = import_tifffile().TiffFile(path)               # Arquivo TIFF aberto
+        self.page = self.tiff.pages[0]                             # Primeira página (mosaico principal)
+        self.lock = threading.Lock()                               # Protege o ponteiro do arquivo
+        height, width = self.page.shape[:2]                        # Dimensões da imagem
+        self.shape = (height, width, 3)                            # Blocos são sempre entregues em BGR
+        self.tile_shape = (self.page.tilelength, self.page.tilewidth)  # Dimensões dos blocos nativos
+        self.tiles_across = -(-width // self.page.tilewidth)       # Blocos por linha
+
+    def read_tile(self, tile_y, tile_x):
+        """
+        Lê e decodifica o bloco nativo (tile_y, tile_x), convertendo para BGR
+        """
+        index = tile_y * self.tiles_across + tile_x                # Índice do bloco no arquivo
+        with self.lock:                                            # Leitura sequencial do arquivo
+            handle = self.tiff.filehandle
+            handle.seek(self.page.dataoffsets[index])
+            data = handle.read(self.page.databytecounts[index])
+        segment = self.page.decode(data, index, jpegtables=self.page.jpegtables)[0]
+        tile = segment.reshape(segment.shape[-3:])                 # Remove eixos de amostra e profundidade
+
+        # Recorta o preenchimento dos blocos da borda
+        tile_h, tile_w = self.tile_shape
+        height, width = self.shape[:2]
+        tile = tile[:min(tile_h, height - tile_y * tile_h), :min(tile_w, width - tile_x * tile_w)]
+        return to_bgr(tile)                                        # Converte RGB/cinza para BGR
+
+    def close(self):
+        """
+        Fecha o arquivo TIFF
+        """
+        self.tiff.close()
+
+
+class TiledRaster:
+    """
+    Acesso em blocos a um mosaico, com cache LRU limitado por um orçamento de bytes
+    Apenas os blocos sobrepostos por uma consulta são lidos
+    """
+    def __init__(self, source, cache_bytes=DEFAULT_CACHE_BYTES):
+        self.source = source                                       # Fonte de pixels (array ou TIFF blocado)
+        self.shape = source.shape                                  # Dimensões (altura, largura, 3)
+        self.tile_shape = source.tile_shape                        # Dimensões de cada bloco
+        self.cache_bytes = cache_bytes                             # Orçamento máximo do cache
+        self.cached_bytes = 0                                      # Bytes atualmente em cache
+        self.tiles = OrderedDict()                                 # Cache LRU: (tile_y, tile_x) -> bloco
+        self.lock = threading.Lock()                               # Protege o cache entre threads
+        self.stats = DISABLED_STATS                                # Contadores de blocos lidos e acertos
+
+    def get_tile(self, tile_y, tile_x):
+        """
+        Retorna o bloco (tile_y, tile_x), lendo da fonte apenas se não estiver em cache
+        """
+        key = (tile_y, tile_x)
+        with self.lock:
+            tile = self.tiles.get(key)
+            if tile is not None:                                   # Bloco já decodificado
+                self.tiles.move_to_end(key)                        # Marca como usado recentemente
+        if tile is not None:
+            self.stats.count("tile_cache_hits")
+            return tile
+
+        with self.stats.stage("read_tiles"):
+            tile = self.source.read_tile(tile_y, tile_x)           # Lê o bloco da fonte
+        self.stats.count("tiles_read")
+        with self.lock:
+            if key not in self.tiles:
+                self.tiles[key] = tile
+                self.cached_bytes += tile.nbytes
+                # Descarta os blocos menos usados até respeitar o orçamento
+                while self.cached_bytes > self.cache_bytes and len(self.tiles) > 1:
+                    _, evicted = self.tiles.popitem(last=False)
+                    self.cached_bytes -= evicted.nbytes
+        return tile
+
+    def tile_ranges(self, x1, y1, x2, y2):
+        """
+        Intervalos de linhas e colunas de blocos sobrepostos pela região [y1:y2, x1:x2]
+        """
+        tile_h, tile_w = self.tile_shape
+        return (range(y1 // tile_h, (y2 - 1) // tile_h + 1),
+                range(x1 // tile_w, (x2 - 1) // tile_w + 1))
+
+    def iter_tiles(self, x1, y1, x2, y2):
+        """
+        Percorre os blocos sobrepostos pela região [y1:y2, x1:x2], retornando
+        cada bloco junto com o recorte local correspondente à região
+        """
+        tile_h, tile_w = self.tile_shape
+        tile_rows, tile_cols = self.tile_ranges(x1, y1, x2, y2)
+        for tile_y in tile_rows:                                   # Linhas de blocos sobrepostas
+            top = tile_y * tile_h                                  # Linha inicial do bloco
+            for tile_x in tile_cols:                               # Colunas de blocos sobrepostas
+                left = tile_x * tile_w                             # Coluna inicial do bloco
+                tile = self.get_tile(tile_y, tile_x)
+                yield tile[max(y1 - top, 0):min(y2 - top, tile_h),
+                           max(x1 - left, 0):min(x2 - left, tile_w)], top, left
+
+    def region_sum(self, x1, y1, x2, y2, progress=None):
+        """
+        Soma de cada canal na região [y1:y2, x1:x2], acumulada em 64 bits
+        Se informado, progress(lidos, total) é chamado após cada bloco lido
+        """
+        tile_rows, tile_cols = self.tile_ranges(x1, y1, x2, y2)
+        tiles = len(tile_rows) * len(tile_cols)                    # Blocos a ler
+        total = np.zeros(self.shape[2], dtype=np.int64)            # Acumulador por canal
+        for done, (window, _, _) in enumerate(self.iter_tiles(x1, y1, x2, y2), 1):  # Para cada recorte
+            total += window.sum(axis=(0, 1), dtype=np.int64)
+            if progress is not None:
+                progress(done, tiles)
+        return total
+
+    def read_window(self, x1, y1, x2, y2):
+        """
+        Monta a região [y1:y2, x1:x2] como um array BGR contíguo
+        """
+        window = np.empty((y2 - y1, x2 - x1, self.shape[2]), dtype=np.uint8)
+        for part, top, left in self.iter_tiles(x1, y1, x2, y2):    # Copia cada recorte para sua posição
+            row = max(top, y1) - y1
+            col = max(left, x1) - x1
+            window[row:row + part.shape[0], col:col + part.shape[1]] = part
+        return window
+
+    def clear_cache(self):
+        """
+        Esvazia o cache de blocos
+        """
+        with self.lock:
+            self.tiles.clear()
+            self.cached_bytes = 0
+
+    def close(self):
+        """
+        Esvazia o cache e fecha a fonte de pixels
+        """
+        self.clear_cache()
+        self.source.close()
+
+
+def to_bgr(pixels):
+    """
+    Converte pixels em cinza, RGB ou RGBA (ordem do TIFF) para BGR de 3 canais (ordem do OpenCV)
+    Pixels em cinza podem vir como (altura, largura) ou (altura, largura, 1)
+    """
+    if pixels.ndim == 2:                                           # Cinza sem eixo de amostras
+        pixels = pixels[:, :, None]
+    if pixels.shape[2] == 1:                                       # Imagem em tons de cinza
+        return np.repeat(pixels, 3, axis=2)
+    return np.ascontiguousarray(pixels[:, :, 2::-1])               # Descarta alfa e inverte RGB->BGR
+
+
+def import_tifffile():
+    """
+    Importa o tifffile sob demanda, pois é uma dependência opcional e de importação lenta
+    Retorna None se o pacote não estiver instalado
+    """
+    try:
+        import tifffile
+    except ImportError:
+        return None
+    return tifffile
+
+
+def file_sha256(path):
+    """
+    Calcula o hash SHA-256 de um arquivo, lendo-o em partes
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(HASH_CHUNK), b""):   # Lê até o fim do arquivo
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_signature(path):
+    """
+    Assinatura de um arquivo de origem: tamanho, data de modificação e hash do conteúdo
+    """
+    status = os.stat(path)
+    return {"source_size": status.st_size, "source_mtime": status.st_mtime,
+            "source_sha256": file_sha256(path)}
+
+
+def signature_matches(path, signature):
+    """
+    Verifica se o arquivo ainda corresponde à assinatura gravada
+    Tamanho e data iguais bastam; se apenas a data mudou, confirma pelo hash do conteúdo
+    """
+    status = os.stat(path)
+    if status.st_size != signature.get("source_size"):             # Tamanho diferente: arquivo mudou
+        return False
+    if status.st_mtime == signature.get("source_mtime"):           # Mesma data: arquivo inalterado
+        return True
+    return file_sha256(path) == signature.get("source_sha256")     # Data mudou: compara o conteúdo
+
+
+def tiff_layout_supported(page):
+    """
+    Verifica se a página do TIFF tem pixels de 8 bits contíguos em RGB(A) ou em tons de cinza,
+    os únicos arranjos que to_bgr converte; paletas, planos separados e outros espaços de cor
+    são decodificados pelo OpenCV
+    """
+    tifffile = import_tifffile()
+    if page.dtype != np.uint8 or page.planarconfig != tifffile.PLANARCONFIG.CONTIG:
+        return False
+    if page.photometric == tifffile.PHOTOMETRIC.RGB:               # RGB, com ou sem alfa
+        return page.samplesperpixel >= 3
+    return page.photometric == tifffile.PHOTOMETRIC.MINISBLACK and page.samplesperpixel == 1
+
+
+def is_tiled_tiff(path):
+    """
+    Verifica se o arquivo é um TIFF blocado de 8 bits, em RGB ou cinza contíguos, cujos blocos
+    o tifffile consegue decodificar (algumas compressões exigem o pacote opcional imagecodecs)
+    """
+    if import_tifffile() is None:                                  # Dependência opcional ausente
+        return False
+    try:
+        source = TiffTileSource(path)
+    except Exception:                                              # Não é um TIFF legível
+        return False
+    try:
+        page = source.page
+        if not (page.is_tiled and page.tiledepth == 1 and tiff_layout_supported(page)):
+            return False
+        source.read_tile(0, 0)                                     # Confirma que a compressão é suportada
+        return True
+    except Exception:                                              # Compressão ou formato não suportado
+        return False
+    finally:
+        source.close()
+
+
+def convert_to_sidecar(path, sidecar_path):
+    """
+    Decodifica a imagem uma única vez e grava um arquivo .npy BGR que pode ser mapeado em memória,
+    junto com a assinatura da imagem de origem usada para validá-lo nas próximas execuções
+    Com o tifffile a decodificação é feita direto em disco, sem carregar a imagem inteira na RAM
+    """
+    tifffile = import_tifffile()
+    temporary_path = sidecar_path + ".tmp"                         # Grava em arquivo temporário
+    decoded = None
+    if tifffile is not None and path.lower().endswith((".tif", ".tiff")):
+        try:
+            with tifffile.TiffFile(path) as tiff:
+                page = tiff.pages[0]                               # Primeira página (mosaico principal)
+                if tiff_layout_supported(page):                    # Demais arranjos ficam com o OpenCV
+                    decoded = page.asarray(out="memmap")           # Decodificação em arquivo mapeado
+        except Exception:                                          # Compressão não suportada: usa o OpenCV
+            decoded = None
+    if decoded is not None:
+        height, width = decoded.shape[:2]
+        output = np.lib.format.open_memmap(temporary_path, mode="w+", dtype=np.uint8,
+                                           shape=(height, width, 3))
+        for row in range(0, height, COPY_ROWS):                    # Copia em faixas de linhas
+            output[row:row + COPY_ROWS] = to_bgr(decoded[row:row + COPY_ROWS])
+        output.flush()
+        del output, decoded
+    else:
+        import cv2                                                 # Importação lenta, feita sob demanda
+        image = cv2.imread(path)                                   # Decodificação completa pelo OpenCV
+        if image is None:
+            raise ValueError(f"Falha ao decodificar '{path}'")
+        with open(temporary_path, "wb") as handle:                 # Evita que np.save acrescente a extensão
+            np.save(handle, image)
+    os.replace(temporary_path, sidecar_path)                       # Publica o arquivo completo
+    write_signature(path, sidecar_path)
+
+
+def discard_file(path):
+    """
+    Remove um arquivo temporário incompleto, ignorando falhas
+    """
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def write_signature(path, sidecar_path):
+    """
+    Grava, ao lado do arquivo auxiliar, a assinatura da imagem de origem usada para validá-lo
+    """
+    with open(sidecar_path + SIGNATURE_SUFFIX, "w") as handle:
+        json.dump(source_signature(path), handle)
+
+
+def sidecar_is_valid(path, sidecar_path):
+    """
+    Verifica se o .npy auxiliar existe e foi gerado a partir da versão atual da imagem
+    """
+    signature_path = sidecar_path + SIGNATURE_SUFFIX
+    if not os.path.exists(sidecar_path) or not os.path.exists(signature_path):
+        return False
+    with open(signature_path) as handle:
+        signature = json.load(handle)
+    if not signature_matches(path, signature):                     # Imagem de origem mudou
+        return False
+
+    # Mesmo conteúdo com nova data: atualiza a assinatura para evitar recalcular o hash
+    mtime = os.stat(path).st_mtime
+    if signature["source_mtime"] != mtime:
+        signature["source_mtime"] = mtime
+        try:
+            with open(signature_path, "w") as handle:
+                json.dump(signature, handle)
+        except OSError:                                            # Pasta sem escrita: apenas recalcula na próxima vez
+            pass
+    return True
+
+
+def load_decoded(path):
+    """
+    Retorna o mosaico decodificado (BGR) mapeado em memória a partir do .npy auxiliar,
+    gerando-o na primeira execução ou quando a imagem de origem mudar
+    O .npy é apenas um cache: se não puder ser gravado ou lido (pasta sem permissão de escrita,
+    disco cheio), o mosaico é decodificado em memória pelo OpenCV
+    """
+    sidecar_path = path + SIDECAR_SUFFIX                           # Arquivo auxiliar ao lado da imagem
+    try:
+        if not sidecar_is_valid(path, sidecar_path):               # Ausente ou desatualizado
+            convert_to_sidecar(path, sidecar_path)
+        return np.load(sidecar_path, mmap_mode="r")
+    except OSError:                                                # Cache indisponível
+        discard_file(sidecar_path + ".tmp")
+    import cv2                                                     # Importação lenta, feita sob demanda
+    image = cv2.imread(path)                                       # Decodificação completa em memória
+    if image is None:
+        raise ValueError(f"Falha ao decodificar '{path}'")
+    return image
+
+
+def open_raster(path, tile_size=DEFAULT_TILE_SIZE, cache_bytes=DEFAULT_CACHE_BYTES):
+    """
+    Abre um mosaico para acesso em blocos:
+    arquivos .npy são mapeados em memória, TIFFs blocados são lidos bloco a bloco e
+    os demais formatos são convertidos uma vez para um .npy auxiliar ao lado da imagem
+    """
+    if path.lower().endswith(SIDECAR_SUFFIX):                      # Já é um array NumPy
+        source = ArraySource(np.load(path, mmap_mode="r"), tile_size)
+    elif is_tiled_tiff(path):                                      # TIFF blocado: leitura por janela
+        source = TiffTileSource(path)
+    else:
+        source = ArraySource(load_decoded(path), tile_size)        # .npy auxiliar mapeado em memória
+    return TiledRaster(source, cache_bytes)
@@ -0,0 +1,510 @@
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from http.client import HTTPConnection
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import shared_memory
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from lunar_cli import INPUT_FIELDS, analyze_record
+from lunar_core import LunarFeOCore, ImageLoadError
+from lunar_pyramid import FeOPyramid
+from lunar_raster import TiledRaster
+from lunar_survey import attach_image, share_image
+
+
+DEFAULT_HOST = "127.0.0.1"                                         # Atende apenas a máquina local
+DEFAULT_PORT = 8765                                                # Porta padrão do serviço
+BATCH_WINDOW = 0.002                                               # Espera máxima (s) para agrupar consultas
+BATCH_MAX = 256                                                    # Consultas por tarefa enviada ao pool
+LATENCY_WINDOW = 10000                                             # Latências mantidas para os percentis
+THROUGHPUT_WINDOW = 10.0                                           # Janela (s) da vazão recente
+SHARED_ARRAYS = ("clementine_image", "integral_image", "class_integrals")  # Arrays copiados para memória compartilhada
+WORKER_STATE = {}                                                  # Núcleo de análise de cada processo
+
+
+def share_core(core, distribution=False):
+    """
+    Prepara o compartilhamento do mosaico e das tabelas acumuladas com os processos
+    Arrays em memória são copiados uma única vez para memória compartilhada e o núcleo principal
+    passa a usar essas cópias; mosaicos e tabelas mapeados (.npy) ou em blocos são abertos por cada processo
+    As contagens por classe (44 bytes por pixel) só são construídas e compartilhadas com distribution=True;
+    sem elas, cada processo classifica os pixels da região consultada
+    Retorna a descrição usada pelos processos e os blocos de memória compartilhada a liberar
+    """
+    image = core.clementine_image
+    description = {"image": None, "arrays": {}, "files": {}}
+    if isinstance(image, TiledRaster) or isinstance(image, np.memmap):
+        if isinstance(image, np.memmap):                           # Mosaico decodificado mapeado do disco
+            description["image"] = ("npy", image.filename, None)
+        else:
+            description["image"] = share_image(core)[0]            # Mesmo compartilhamento do levantamento
+
+    if distribution:
+        core.get_class_integrals()                                 # Construídas uma vez aqui, não em cada processo
+    blocks = []
+    try:
+        for name in SHARED_ARRAYS:
+            array = getattr(core, name)
+            if isinstance(array, np.memmap) and name != "clementine_image":
+                description["files"][name] = array.filename        # Tabela mapeada, aberta por cada processo
+                continue
+            if array is None or isinstance(array, (TiledRaster, np.memmap)):
+                continue                                           # Ausente ou já compartilhado pelo disco
+            block = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+            blocks.append(block)
+            shared = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+            shared[:] = array                                      # Cópia única para memória compartilhada
+            shared.flags.writeable = False
+            setattr(core, name, shared)                            # Libera o original no processo principal
+            description["arrays"][name] = (block.name, array.shape, array.dtype.str)
+    except BaseException:                                          # Falta de memória: libera os blocos já criados
+        release_blocks(blocks)
+        raise
+    return description, blocks
+
+
+def release_blocks(blocks):
+    """
+    Fecha e remove os blocos de memória compartilhada
+    """
+    for block in blocks:
+        block.close()
+        block.unlink()
+
+
+def init_worker(description, clementine_path, scale_path, pyramid, palette):
+    """
+    Inicializa o núcleo de análise de um processo com o mosaico e as tabelas compartilhadas
+    """
+    core = LunarFeOCore(clementine_path, scale_path, precompute=False)  # Núcleo sem tabelas próprias
+    if description["image"] is not None:
+        core.clementine_image = attach_image(description["image"])
+    for name, (block_name, shape, dtype) in description["arrays"].items():
+        block = shared_memory.SharedMemory(name=block_name)
+        WORKER_STATE.setdefault("blocks", []).append(block)        # Mantém o bloco aberto no processo
+        array = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        array.flags.writeable = False
+        setattr(core, name, array)
+    for name, filename in description["files"].items():
+        setattr(core, name, np.load(filename, mmap_mode="r"))
+    if pyramid:                                                    # Pirâmide mapeada, compartilhada pelo disco
+        core.pyramid = FeOPyramid.load(clementine_path)
+    if palette:                                                    # Paleta densa já gravada pelo processo principal
+        core.load_palette(lut=False)                               # Médias em ponto flutuante usam só as cores
+    WORKER_STATE["core"] = core
+
+
+def analyze_batch(items):
+    """
+    Analisa, em um processo do pool, uma lista de (região, tolerância, distribuição)
+    Erros de cada região são registrados no campo 'error' do seu resultado
+    """
+    core = WORKER_STATE["core"]
+    results = []
+    for record, tolerance, distribution in items:
+        try:
+            results.append(analyze_record(core, record, tolerance, distribution))
+        except Exception as e:                                     # Falha inesperada afeta apenas esta região
+            output = {field: record.get(field) for field in INPUT_FIELDS} if isinstance(record, dict) else {}
+            output["error"] = f"Erro inesperado: {e}"
+            results.append(output)
+    return results
+
+
+class RequestBatcher:
+    """
+    Agrupa consultas que chegam juntas de clientes diferentes em uma única tarefa do pool,
+    reduzindo o custo de comunicação entre processos por consulta
+    """
+    def __init__(self, pool, window=BATCH_WINDOW, max_size=BATCH_MAX):
+        self.pool = pool                                           # Pool de processos de análise
+        self.window = window                                       # Espera máxima para formar um grupo
+        self.max_size = max_size                                   # Consultas máximas por grupo
+        self.pending = queue.Queue()                               # (itens, Future) aguardando envio
+        self.batches = 0                                           # Tarefas enviadas ao pool
+        self.batched_items = 0                                     # Consultas enviadas ao pool
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, items):
+        """
+        Enfileira uma lista de itens e retorna um Future com a lista de resultados na mesma ordem
+        """
+        future = Future()
+        self.pending.put((items, future))
+        return future
+
+    def run(self):
+        """
+        Laço da thread de agrupamento: espera a primeira consulta e junta as que chegarem
+        dentro da janela, até o tamanho máximo do grupo
+        """
+        while True:
+            entry = self.pending.get()
+            if entry is None:                                      # Encerramento do serviço
+                return
+            group, size = [entry], len(entry[0])
+            deadline = time.perf_counter() + self.window
+            while size < self.max_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    entry = self.pending.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if entry is None:                                  # Repassa o encerramento ao laço externo
+                    self.pending.put(None)
+                    break
+                group.append(entry)
+                size += len(entry[0])
+            self.dispatch(group)
+
+    def dispatch(self, group):
+        """
+        Envia um grupo ao pool e distribui os resultados aos Futures de cada requisição
+        """
+        items = [item for entry_items, _ in group for item in entry_items]
+        self.batches += 1
+        self.batched_items += len(items)
+        task = self.pool.submit(analyze_batch, items)
+
+        def deliver(task):
+            try:
+                results = task.result()
+            except Exception as e:                                 # Falha do processo: repassa a todos
+                for _, future in group:
+                    future.set_exception(e)
+                return
+            offset = 0
+            for entry_items, future in group:                      # Fatia os resultados por requisição
+                future.set_result(results[offset:offset + len(entry_items)])
+                offset += len(entry_items)
+        task.add_done_callback(deliver)
+
+    def close(self):
+        """
+        Encerra a thread de agrupamento
+        """
+        self.pending.put(None)
+        self.thread.join()
+
+
+class ServiceStats:
+    """
+    Latência e vazão das requisições atendidas pelo serviço
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()                                 # Início do serviço
+        self.requests = 0                                          # Requisições de consulta atendidas
+        self.queries = 0                                           # Regiões analisadas
+        self.errors = 0                                            # Requisições com erro
+        self.latencies = deque(maxlen=LATENCY_WINDOW)              # Latências recentes em segundos
+        self.completions = deque()                                 # (instante, regiões) da janela de vazão
+
+    def record(self, queries, seconds, error=False):
+        """
+        Registra uma requisição concluída
+        """
+        now = time.time()
+        with self.lock:
+            self.requests += 1
+            self.queries += queries
+            self.errors += error
+            self.latencies.append(seconds)
+            self.completions.append((now, queries))
+            while self.completions and self.completions[0][0] < now - THROUGHPUT_WINDOW:
+                self.completions.popleft()                         # Descarta o que saiu da janela
+
+    def snapshot(self):
+        """
+        Contadores, vazão total e recente e percentis de latência (em milissegundos)
+        """
+        now = time.time()
+        with self.lock:
+            latencies = np.array(self.latencies) * 1000
+            recent = sum(count for moment, count in self.completions if moment >= now - THROUGHPUT_WINDOW)
+            uptime = now - self.started
+            result = {"uptime_s": round(uptime, 3), "requests": self.requests, "queries": self.queries,
+                      "errors": self.errors, "queries_per_s": self.queries / uptime if uptime else 0.0,
+                      "recent_queries_per_s": recent / min(THROUGHPUT_WINDOW, uptime) if uptime else 0.0}
+        if len(latencies):
+            result["latency_ms"] = {"mean": float(latencies.mean()), "max": float(latencies.max()),
+                                    **{f"p{p}": float(np.percentile(latencies, p)) for p in (50, 95, 99)}}
+        return result
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """
+    Rotas HTTP/JSON do serviço:
+      GET  /health              estado do serviço e dimensões do mosaico
+      GET  /stats               latência, vazão e agrupamento
+      GET  /query?max_ns=...    uma região pelos parâmetros da URL
+      POST /query               uma região, uma lista ou {"regions": [...], "tolerance", "distribution"}
+    """
+    protocol_version = "HTTP/1.1"                                  # Conexões persistentes (keep-alive)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        service = self.server.service
+        if url.path == "/health":
+            self.send_json(200, service.health())
+        elif url.path == "/stats":
+            self.send_json(200, service.stats_snapshot())
+        elif url.path == "/query":
+            params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            self.answer({"regions": [params], "tolerance": params.get("tolerance", 0),
+                         "distribution": params.get("distribution", "")}, single=True)
+        else:
+            self.send_json(404, {"error": f"rota desconhecida: {url.path}"})
+
+    def do_POST(self):
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:                                         # Fim do corpo desconhecido
+            self.close_connection = True                           # Não reaproveita a conexão
+            self.send_json(400, {"error": "Content-Length inválido"})
+            return
+        body = self.rfile.read(length)                             # Lido sempre, mantendo a conexão sincronizada
+        if urlparse(self.path).path != "/query":
+            self.send_json(404, {"error": f"rota desconhecida: {self.path}"})
+            return
+        try:
+            payload = json.loads(body or b"null")
+        except ValueError as e:                                    # Corpo ausente ou JSON inválido
+            self.send_json(400, {"error": f"JSON inválido: {e}"})
+            return
+        if isinstance(payload, list):                              # Lista simples de regiões
+            payload = {"regions": payload}
+        if not isinstance(payload, dict):
+            self.send_json(400, {"error": "esperado um objeto ou uma lista de regiões"})
+            return
+        single = "regions" not in payload                          # Uma única região com suas opções
+        if single:
+            payload = {"regions": [payload], "tolerance": payload.get("tolerance"),
+                       "distribution": payload.get("distribution")}
+        self.answer(payload, single)
+
+    def answer(self, payload, single):
+        """
+        Analisa as regiões do pedido pelo pool e responde com um resultado ou uma lista
+        """
+        start = time.perf_counter()
+        service = self.server.service
+        regions = payload.get("regions")
+        try:
+            if not isinstance(regions, list):
+                raise ValueError("'regions' deve ser uma lista")
+            if not all(isinstance(region, dict) for region in regions):  # Não chega ao grupo de outros clientes
+                raise ValueError("cada região deve ser um objeto com max_ns, min_ns, max_ol e min_ol")
+            tolerance = float(payload.get("tolerance") or 0)
+            distribution = str(payload.get("distribution", "")).lower() in ("1", "true", "yes")
+            results = service.analyze(regions, tolerance, distribution)
+        except ValueError as e:                                    # Parâmetros inválidos do pedido
+            service.stats.record(0, time.perf_counter() - start, error=True)
+            self.send_json(400, {"error": str(e)})
+            return
+        except Exception as e:                                     # Falha no pool de processos
+            service.stats.record(0, time.perf_counter() - start, error=True)
+            self.send_json(500, {"error": f"Erro inesperado: {e}"})
+            return
+        self.send_json(200, results[0] if single else {"results": results})
+        service.stats.record(len(regions), time.perf_counter() - start)
+
+    def send_json(self, status, body):
+        """
+        Envia uma resposta JSON com Content-Length, o que mantém a conexão aberta
+        """
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.service.verbose:                            # Log de acesso apenas se pedido
+            super().log_message(format, *args)
+
+
+class QueryService:
+    """
+    Serviço local que carrega o mosaico uma única vez e responde consultas de vários clientes
+    As análises são feitas por um pool de processos que compartilham o mosaico e as tabelas
+    acumuladas por memória compartilhada
+    """
+    def __init__(self, core, host=DEFAULT_HOST, port=DEFAULT_PORT, workers=None,
+                 batch_window=BATCH_WINDOW, batch_max=BATCH_MAX, verbose=False, distribution=False):
+        self.core = core                                           # Núcleo com o mosaico carregado
+        self.workers = workers or os.cpu_count() or 1              # Processos de análise
+        self.batch_max = batch_max                                 # Consultas por tarefa do pool
+        self.verbose = verbose                                     # Log de acesso HTTP
+        self.stats = ServiceStats()
+        self.thread = None
+
+        # A porta é ligada antes de alocar memória compartilhada e processos, que vazariam se ela falhasse
+        self.server = ThreadingHTTPServer((host, port), QueryHandler)
+        self.server.daemon_threads = True
+        self.server.service = self
+        self.address = self.server.server_address                 # (host, porta) efetivos
+        try:
+            self.description, self.blocks = share_core(core, distribution)
+        except BaseException:
+            self.server.server_close()
+            raise
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker,
+                                        initargs=(self.description, core.clementine_path, core.scale_path,
+                                                  core.pyramid is not None, core.palette is not None))
+        self.batcher = RequestBatcher(self.pool, batch_window, batch_max)
+
+    def analyze(self, regions, tolerance=0, distribution=False):
+        """
+        Analisa uma lista de regiões no pool; pedidos pequenos são agrupados com os de outros
+        clientes e pedidos grandes são divididos entre os processos
+        """
+        items = [(region, tolerance, distribution) for region in regions]
+        if len(items) <= self.batch_max:                           # Agrupa com pedidos simultâneos
+            return self.batcher.submit(items).result()
+        futures = [self.pool.submit(analyze_batch, items[start:start + self.batch_max])
+                   for start in range(0, len(items), self.batch_max)]
+        return [result for future in futures for result in future.result()]
+
+    def health(self):
+        """
+        Estado do serviço e dimensões do mosaico carregado
+        """
+        height, width = self.core.clementine_image.shape[:2]
+        return {"status": "ok", "height": height, "width": width, "workers": self.workers,
+                "fields": INPUT_FIELDS, "pyramid": self.core.pyramid is not None}
+
+    def stats_snapshot(self):
+        """
+        Estatísticas de latência e vazão, com o agrupamento de consultas
+        """
+        snapshot = self.stats.snapshot()
+        batches = self.batcher.batches
+        snapshot.update(workers=self.workers, batches=batches,
+                        mean_batch_size=self.batcher.batched_items / batches if batches else 0.0)
+        return snapshot
+
+    def start(self):
+        """
+        Atende as requisições em uma thread separada
+        """
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def close(self):
+        """
+        Encerra o servidor, o pool de processos e libera a memória compartilhada
+        """
+        if self.thread is not None:
+            self.server.shutdown()
+            self.thread.join()
+        self.server.server_close()
+        self.batcher.close()
+        self.pool.shutdown()
+        release_blocks(self.blocks)
+        self.blocks = []
+
+
+class ServiceClient:
+    """
+    Cliente do serviço local com uma conexão persistente (keep-alive)
+    """
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=60):
+        self.connection = HTTPConnection(host, port, timeout=timeout)
+
+    def request(self, method, path, payload=None):
+        """
+        Envia um pedido e retorna a resposta JSON; erros HTTP lançam RuntimeError
+        """
+        body = None if payload is None else json.dumps(payload).encode("utf-8")
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        self.connection.request(method, path, body=body, headers=headers)
+        response = self.connection.getresponse()
+        data = json.loads(response.read())
+        if response.status != 200:
+            raise RuntimeError(data.get("error", f"HTTP {response.status}"))
+        return data
+
+    def analyze(self, max_ns, min_ns, max_ol, min_ol, tolerance=0, distribution=False):
+        """
+        Analisa uma região
+        """
+        return self.request("POST", "/query", {"max_ns": max_ns, "min_ns": min_ns, "max_ol": max_ol,
+                                               "min_ol": min_ol, "tolerance": tolerance,
+                                               "distribution": distribution})
+
+    def analyze_batch(self, regions, tolerance=0, distribution=False):
+        """
+        Analisa uma lista de regiões (dicionários ou sequências max_ns, min_ns, max_ol, min_ol)
+        """
+        regions = [region if isinstance(region, dict) else dict(zip(INPUT_FIELDS, region)) for region in regions]
+        return self.request("POST", "/query", {"regions": regions, "tolerance": tolerance,
+                                               "distribution": distribution})["results"]
+
+    def stats(self):
+        """
+        Estatísticas de latência e vazão do serviço
+        """
+        return self.request("GET", "/stats")
+
+    def close(self):
+        self.connection.close()
+
+
+def main(argv=None):
+    """
+    Inicia o serviço local de consultas de FeO
+    """
+    parser = argparse.ArgumentParser(description="Serviço local HTTP/JSON de consultas de FeO sobre um mosaico carregado uma vez")
+    parser.add_argument("--image", default="clementine.tif", help="caminho da imagem Clementine")
+    parser.add_argument("--scale", default="escala-clementine.jpeg", help="caminho da escala de cores")
+    parser.add_argument("--tiled", action="store_true", help="lê o mosaico em blocos sob demanda")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="endereço de escuta (padrão: apenas local)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="porta de escuta (0 escolhe uma livre)")
+    parser.add_argument("--workers", type=int, help="quantidade de processos (padrão: núcleos da CPU)")
+    parser.add_argument("--pyramid", action="store_true", help="carrega a pirâmide de cores para consultas com tolerância (com --tiled)")
+    parser.add_argument("--dense-palette", action="store_true", help="FeO fracionário pela paleta densa amostrada da escala")
+    parser.add_argument("--distribution", action="store_true", help="pré-calcula as contagens por classe (44 bytes por pixel) para consultas de distribuição")
+    parser.add_argument("--batch-window-ms", type=float, default=BATCH_WINDOW * 1000, help="espera para agrupar consultas simultâneas")
+    parser.add_argument("--batch-max", type=int, default=BATCH_MAX, help="consultas por tarefa do pool")
+    parser.add_argument("--verbose", action="store_true", help="mostra o log de acesso HTTP")
+    args = parser.parse_args(argv)
+
+    core = LunarFeOCore(args.image, args.scale, tiled=args.tiled, dense_palette=args.dense_palette)
+    try:
+        core.load_images()
+    except ImageLoadError as e:
+        print(f"Erro: {e}", file=sys.stderr)
+        return 1
+    if args.pyramid:
+        core.load_pyramid()
+
+    service = QueryService(core, args.host, args.port, args.workers,
+                           args.batch_window_ms / 1000, args.batch_max, args.verbose, args.distribution)
+    host, port = service.address
+    print(f"Serviço de FeO em http://{host}:{port} com {service.workers} processos.", file=sys.stderr)
+    try:
+        service.server.serve_forever()
+    except KeyboardInterrupt:                                      # Encerramento pelo terminal
+        pass
+    finally:
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":                                         # Execução direta
+    sys.exit(main())                                               # Chama função principal
@@ -0,0 +1,194 @@
+import cProfile
+import io
+import json
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+PROFILE_LIMIT = 20                                                 # Funções listadas no perfil de cada consulta
+
+
+class NullStage:
+    """
+    Etapa sem medição, usada quando a instrumentação está desativada
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_STAGE = NullStage()                                           # Instância única, sem alocação por chamada
+
+
+class Stage:
+    """
+    Mede uma etapa com relógio de alta resolução e registra a duração ao sair
+    """
+    __slots__ = ("stats", "name", "start")
+
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stats.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class AnalysisStats:
+    """
+    Temporizadores por etapa e contadores da análise (pixels lidos, acertos de cache, blocos lidos)
+    Desativada, cada etapa custa apenas o retorno de um objeto nulo
+    Com log_stream, cada consulta (ou etapa avulsa) gera uma linha JSON no arquivo
+    Com profile=True, cada consulta é executada sob cProfile e tracemalloc
+    """
+    def __init__(self, enabled=False, log_stream=None, profile=False, profile_limit=PROFILE_LIMIT):
+        self.enabled = enabled or log_stream is not None or profile  # Log e perfil implicam medição
+        self.log_stream = log_stream                               # Destino das linhas JSON (ou None)
+        self.profile = profile                                     # Captura cProfile/tracemalloc por consulta
+        self.profile_limit = profile_limit                         # Funções listadas no perfil
+        self.lock = threading.Lock()                               # Protege os acumuladores entre threads
+        self.local = threading.local()                             # Consulta em andamento de cada thread
+        self.profile_lock = threading.Lock()                       # Um único perfil ativo por vez
+        self.last_profile = None                                   # Perfil da última consulta capturada
+        self.reset()
+
+    def reset(self):
+        """
+        Zera temporizadores, contadores e a contagem de consultas
+        """
+        with self.lock:
+            self.stages = {}                                       # etapa -> [chamadas, total, máximo]
+            self.counters = {}                                     # contador -> valor
+            self.queries = 0                                       # Consultas concluídas
+
+    def stage(self, name):
+        """
+        Contexto que mede a etapa 'name'
+        """
+        if not self.enabled:
+            return NULL_STAGE
+        return Stage(self, name)
+
+    def record(self, name, seconds):
+        """
+        Acumula a duração de uma etapa no total e na consulta em andamento da thread
+        """
+        with self.lock:
+            entry = self.stages.get(name)
+            if entry is None:
+                self.stages[name] = [1, seconds, seconds]
+            else:
+                entry[0] += 1
+                entry[1] += seconds
+                entry[2] = max(entry[2], seconds)
+        current = getattr(self.local, "current", None)
+        if current is not None:                                    # Etapa dentro de uma consulta
+            current["stages"][name] = current["stages"].get(name, 0.0) + seconds
+        elif self.log_stream is not None:                          # Etapa avulsa (ex.: exibição na interface)
+            self.write_log({"event": "stage", "stage": name, "seconds": seconds})
+
+    def count(self, name, amount=1):
+        """
+        Soma 'amount' ao contador 'name'
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+        current = getattr(self.local, "current", None)
+        if current is not None:
+            current["counters"][name] = current["counters"].get(name, 0) + amount
+
+    @contextmanager
+    def query(self, **fields):
+        """
+        Agrupa as etapas e contadores de uma consulta completa da thread atual
+        Ao final gera a linha JSON da consulta e, no modo de perfil, guarda o perfil capturado
+        """
+        if not self.enabled:
+            yield None
+            return
+        if getattr(self.local, "current", None) is not None:      # Consulta já aberta nesta thread
+            yield self.local.current
+            return
+
+        current = {"event": "query", **fields, "stages": {}, "counters": {}}
+        self.local.current = current
+        profiler = None
+        if self.profile and self.profile_lock.acquire(blocking=False):  # Ignora perfis simultâneos
+            profiler = cProfile.Profile()
+            started_tracing = not tracemalloc.is_tracing()
+            if started_tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            profiler.enable()
+        start = time.perf_counter()
+        try:
+            yield current
+        except BaseException as e:
+            current["error"] = type(e).__name__
+            raise
+        finally:
+            current["seconds"] = time.perf_counter() - start
+            if profiler is not None:
+                profiler.disable()
+                current["memory_peak_bytes"] = tracemalloc.get_traced_memory()[1]
+                if started_tracing:
+                    tracemalloc.stop()
+                self.profile_lock.release()
+                current["profile"] = self.profile_summary(profiler)
+                self.last_profile = {"memory_peak_bytes": current["memory_peak_bytes"],
+                                     "functions": current["profile"], "profiler": profiler}
+            self.local.current = None
+            with self.lock:
+                self.queries += 1
+            if self.log_stream is not None:
+                self.write_log(current)
+
+    def profile_summary(self, profiler):
+        """
+        Funções com maior tempo acumulado: [função, chamadas, tempo próprio, tempo acumulado]
+        """
+        stats = pstats.Stats(profiler, stream=io.StringIO())
+        rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)
+        return [[f"{path}:{line}({function})", calls, round(own, 6), round(cumulative, 6)]
+                for (path, line, function), (_, calls, own, cumulative, _) in rows[:self.profile_limit]]
+
+    def write_log(self, record):
+        """
+        Escreve um registro como uma linha JSON
+        """
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self.lock:
+            self.log_stream.write(line + "\n")
+            self.log_stream.flush()
+
+    def snapshot(self):
+        """
+        Estatísticas acumuladas: por etapa (chamadas, total, média e máximo em segundos),
+        contadores e número de consultas
+        """
+        with self.lock:
+            stages = {name: {"count": count, "total_s": total, "mean_s": total / count, "max_s": peak}
+                      for name, (count, total, peak) in self.stages.items()}
+            return {"queries": self.queries, "stages": stages, "counters": dict(self.counters)}
+
+    def log_summary(self):
+        """
+        Escreve o resumo acumulado no log, se houver
+        """
+        if self.log_stream is not None:
+            self.write_log({"event": "summary", **self.snapshot()})
+
+
+DISABLED_STATS = AnalysisStats()                                   # Instrumentação desativada compartilhada
@@ -0,0 +1,168 @@
+import argparse
+import csv
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from lunar_core import LunarFeOCore, ImageLoadError
+from lunar_raster import ArraySource, TiledRaster, open_raster
+
+
+BLOCKS_PER_WORKER = 4                                              # Blocos de faixas de latitude por processo
+WORKER_STATE = {}                                                  # Núcleo de análise de cada processo
+
+
+def grid_shape(step):
+    """
+    Número de linhas (latitude) e colunas (longitude) da grade global para um passo em graus
+    """
+    return int(round(180 / step)), int(round(360 / step))
+
+
+def share_image(core):
+    """
+    Prepara o compartilhamento somente leitura do mosaico com os processos
+    Retorna a descrição usada pelos processos e o bloco de memória compartilhada a liberar (ou None)
+    """
+    image = core.clementine_image
+    if isinstance(image, TiledRaster):
+        source = image.source
+        if isinstance(source, ArraySource) and isinstance(source.array, np.memmap):
+            return ("npy", source.array.filename, None), None       # Cada processo mapeia o mesmo .npy
+        return ("raster", core.clementine_path, image.cache_bytes), None  # Cada processo lê os próprios blocos
+
+    # Imagem decodificada em memória: copiada uma única vez para memória compartilhada
+    shared = shared_memory.SharedMemory(create=True, size=image.nbytes)
+    np.ndarray(image.shape, dtype=image.dtype, buffer=shared.buf)[:] = image
+    return ("shm", shared.name, image.shape), shared
+
+
+def attach_image(description):
+    """
+    Abre, em um processo, o mosaico compartilhado pelo processo principal
+    """
+    kind, location, extra = description
+    if kind == "shm":                                              # Memória compartilhada
+        shared = shared_memory.SharedMemory(name=location)
+        WORKER_STATE["shared"] = shared                            # Mantém o bloco aberto no processo
+        image = np.ndarray(extra, dtype=np.uint8, buffer=shared.buf)
+        image.flags.writeable = False
+        return image
+    if kind == "npy":                                              # Arquivo .npy mapeado em memória
+        return np.load(location, mmap_mode="r")
+    return open_raster(location, cache_bytes=extra)                # Mosaico em blocos próprio
+
+
+def init_worker(description):
+    """
+    Inicializa o núcleo de análise de um processo com o mosaico compartilhado
+    """
+    core = LunarFeOCore()                                          # Núcleo sem tabelas pré-calculadas
+    core.clementine_image = attach_image(description)
+    WORKER_STATE["core"] = core
+
+
+def survey_block(row_start, row_stop, step):
+    """
+    Calcula a cor média e o FeO das células das linhas [row_start, row_stop) da grade
+    """
+    core = WORKER_STATE["core"]
+    image = core.clementine_image
+    height, width = image.shape[:2]                                # Dimensões do mosaico
+    cols = grid_shape(step)[1]
+
+    colors = np.empty((row_stop - row_start, cols, 3))             # Cor média BGR de cada célula
+    for row in range(row_start, row_stop):                         # Para cada faixa de latitude
+        lat_max = 90 - row * step
+        lat_min = lat_max - step
+        for col in range(cols):                                    # Para cada faixa de longitude
+            lon_min = -180 + col * step
+            lon_max = lon_min + step
+            x1, y1 = core.geographic_to_pixel(lat_max, lon_min, height, width)  # Canto superior esquerdo
+            x2, y2 = core.geographic_to_pixel(lat_min, lon_max, height, width)  # Canto inferior direito
+            colors[row - row_start, col] = core.get_area_average_color(image, x1, y1, x2, y2)
+    return row_start, colors, core.classify_colors(colors, use_lut=False)  # Classificação vetorizada do bloco
+
+
+def run_survey(core, step=1.0, workers=None):
+    """
+    Levantamento global: cor média, FeO e elemento de cada célula de uma grade lat/lon
+    As faixas de latitude são divididas em blocos processados em paralelo; o mosaico é
+    compartilhado sem cópias por memória compartilhada ou arquivo mapeado
+    Retorna uma grade float32 (linhas, colunas, 4) com os canais B, G, R e FeO
+    """
+    rows, cols = grid_shape(step)
+    workers = workers or os.cpu_count() or 1                       # Um processo por núcleo por padrão
+    grid = np.empty((rows, cols, 4), dtype=np.float32)
+
+    blocks = min(rows, workers * BLOCKS_PER_WORKER)                # Quantidade de blocos de linhas
+    bounds = np.linspace(0, rows, blocks + 1).astype(int)          # Limites dos blocos
+    description, shared = share_image(core)
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                 initargs=(description,)) as pool:
+            futures = [pool.submit(survey_block, start, stop, step)
+                       for start, stop in zip(bounds[:-1], bounds[1:])]
+            for future in futures:                                 # Reúne os blocos na grade
+                row_start, colors, feo = future.result()
+                grid[row_start:row_start + len(colors), :, :3] = colors
+                grid[row_start:row_start + len(colors), :, 3] = feo
+    finally:
+        if shared is not None:                                     # Libera a memória compartilhada
+            shared.close()
+            shared.unlink()
+    return grid
+
+
+def write_survey_csv(path, core, grid, step):
+    """
+    Grava a grade do levantamento em CSV, uma célula por linha
+    """
+    elements = {}                                                  # Elemento associado a cada valor de FeO
+    with open(path, "w", newline="", encoding="utf-8") as handle:
+        writer = csv.writer(handle)
+        writer.writerow(["lat_max", "lat_min", "lon_min", "lon_max", "feo", "element",
+                         "mean_b", "mean_g", "mean_r"])
+        for row in range(grid.shape[0]):
+            lat_max = 90 - row * step
+            for col in range(grid.shape[1]):
+                lon_min = -180 + col * step
+                blue, green, red, feo = grid[row, col].tolist()
+                feo = int(feo)
+                if feo not in elements:
+                    elements[feo] = core.determine_associated_element(feo)
+                writer.writerow([lat_max, lat_max - step, lon_min, lon_min + step, feo, elements[feo],
+                                 round(blue, 3), round(green, 3), round(red, 3)])
+
+
+def main(argv=None):
+    """
+    Levantamento global de FeO pela linha de comando
+    """
+    parser = argparse.ArgumentParser(description="Levantamento global de FeO em uma grade lat/lon, em paralelo")
+    parser.add_argument("output", help="prefixo dos arquivos de saída (<prefixo>.npy e <prefixo>.csv)")
+    parser.add_argument("--image", default="clementine.tif", help="caminho da imagem Clementine")
+    parser.add_argument("--scale", default="escala-clementine.jpeg", help="caminho da escala de cores")
+    parser.add_argument("--step", type=float, default=1.0, help="tamanho da célula em graus")
+    parser.add_argument("--workers", type=int, help="quantidade de processos (padrão: núcleos da CPU)")
+    parser.add_argument("--tiled", action="store_true", help="lê o mosaico em blocos sob demanda")
+    args = parser.parse_args(argv)
+
+    core = LunarFeOCore(args.image, args.scale, tiled=args.tiled, precompute=False)
+    try:
+        core.load_images()
+    except ImageLoadError as e:
+        print(f"Erro: {e}", file=sys.stderr)
+        return 1
+
+    grid = run_survey(core, args.step, args.workers)
+    np.save(args.output + ".npy", grid)                            # Grade binária compacta
+    write_survey_csv(args.output + ".csv", core, grid, args.step)  # Grade em texto
+    return 0
+
+
+if __name__ == "__main__":                                         # Execução direta
+    sys.exit(main())                                               # Chama função principal
@@ -0,0 +1,90 @@
+import os
+
+import numpy as np
+import pytest
+
+from lunar_core import INTEGRAL_SUFFIX, LunarFeOCore
+
+
+def reference_average_color(image, x1, y1, x2, y2):
+    """
+    Cor média calculada como na versão original (recorte e np.mean)
+    """
+    height, width = image.shape[:2]
+    x1 = max(0, min(x1, width - 1))
+    x2 = max(0, min(x2, width - 1))
+    y1 = max(0, min(y1, height - 1))
+    y2 = max(0, min(y2, height - 1))
+    if x1 > x2:
+        x1, x2 = x2, x1
+    if y1 > y2:
+        y1, y2 = y2, y1
+    if x2 - x1 < 1 or y2 - y1 < 1:
+        x2 = x1 + 1
+        y2 = y1 + 1
+    return np.mean(image[y1:y2, x1:x2], axis=(0, 1))
+
+
+def make_core(image, integral=True):
+    core = LunarFeOCore()
+    core.clementine_image = image
+    if integral:
+        core.integral_image = core.build_integral_image(image)
+    return core
+
+
+def test_integral_average_matches_mean():
+    rng = np.random.default_rng(1)
+    image = rng.integers(0, 256, (97, 211, 3), dtype=np.uint8)
+    core = make_core(image)
+    for _ in range(3000):                                          # Inclui cantos fora da imagem e invertidos
+        x1, x2 = rng.integers(-30, 240, 2)
+        y1, y2 = rng.integers(-30, 130, 2)
+        expected = reference_average_color(image, x1, y1, x2, y2)
+        result = core.get_area_average_color(image, x1, y1, x2, y2)
+        np.testing.assert_allclose(result, expected, rtol=0, atol=1e-9)
+
+
+def test_banded_average_with_progress_matches_mean():
+    rng = np.random.default_rng(2)
+    image = rng.integers(0, 256, (64, 80, 3), dtype=np.uint8)
+    core = make_core(image, integral=False)
+    calls = []
+    result = core.get_area_average_color(image, 3, 2, 70, 60, progress=lambda done, total: calls.append(done))
+    np.testing.assert_allclose(result, reference_average_color(image, 3, 2, 70, 60), rtol=0, atol=1e-9)
+    assert calls and calls[-1] == 58
+
+
+def test_decoded_cache_persists_integral_table(tmp_path):
+    cv2 = pytest.importorskip("cv2")
+    image = np.random.default_rng(3).integers(0, 256, (60, 90, 3), dtype=np.uint8)
+    image_path, scale_path = str(tmp_path / "mosaico.png"), str(tmp_path / "escala.png")
+    cv2.imwrite(image_path, image)
+    cv2.imwrite(scale_path, image)
+    core = LunarFeOCore(image_path, scale_path, decoded_cache=True)
+    core.load_images()
+    table_path = image_path + INTEGRAL_SUFFIX
+    written = os.stat(table_path).st_mtime_ns
+    np.testing.assert_array_equal(core.integral_image, core.build_integral_image(image))
+
+    core = LunarFeOCore(image_path, scale_path, decoded_cache=True)
+    core.load_images()                                             # Tabela reaproveitada do disco
+    assert isinstance(core.integral_image, np.memmap)
+    assert os.stat(table_path).st_mtime_ns == written
+    np.testing.assert_allclose(core.get_area_average_color(core.clementine_image, 5, 7, 80, 50),
+                               reference_average_color(image, 5, 7, 80, 50))
+
+
+def test_decoded_cache_falls_back_to_memory_when_unwritable(tmp_path):
+    cv2 = pytest.importorskip("cv2")
+    image = np.random.default_rng(4).integers(0, 256, (40, 50, 3), dtype=np.uint8)
+    image_path, scale_path = str(tmp_path / "mosaico.png"), str(tmp_path / "escala.png")
+    cv2.imwrite(image_path, image)
+    cv2.imwrite(scale_path, image)
+    os.mkdir(image_path + ".npy.tmp")                              # Impede a gravação dos caches
+    os.mkdir(image_path + INTEGRAL_SUFFIX + ".tmp")
+    core = LunarFeOCore(image_path, scale_path, decoded_cache=True)
+    core.load_images()
+    np.testing.assert_array_equal(core.clementine_image, image)
+    assert not isinstance(core.integral_image, np.memmap)
+    np.testing.assert_array_equal(core.integral_image, core.build_integral_image(image))
@@ -0,0 +1,65 @@
+import numpy as np
+
+import lunar_core
+from lunar_core import REFERENCE_COLORS, REFERENCE_FEO, LunarFeOCore
+
+
+def reference_feo(bgr):
+    """
+    Classificação de uma cor BGR como no laço original de compare_with_scale
+    """
+    target_rgb = [bgr[2], bgr[1], bgr[0]]
+    min_distance = float("inf")
+    closest_feo = 0
+    for ref_color, feo_value in REFERENCE_COLORS:
+        distance = np.sqrt(sum((float(target_rgb[i]) - ref_color[i]) ** 2 for i in range(3)))
+        if distance < min_distance:
+            min_distance = distance
+            closest_feo = feo_value
+    return closest_feo
+
+
+def random_colors(count, seed):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 256, (count, 3), dtype=np.uint8)
+
+
+def test_vectorized_classification_matches_loop():
+    core = LunarFeOCore()
+    colors = random_colors(5000, 3)
+    expected = [reference_feo(color) for color in colors]
+    assert core.classify_colors(colors, use_lut=False).tolist() == expected
+    assert core.compare_with_scale(colors[0]) == expected[0]
+
+
+def test_lookup_table_matches_loop():
+    core = LunarFeOCore()
+    core.build_color_lut()
+    colors = random_colors(5000, 4)
+    expected = [reference_feo(color) for color in colors]
+    assert core.classify_colors(colors).tolist() == expected
+    image = colors.reshape(50, 100, 3)
+    assert core.classify_image(image).ravel().tolist() == expected
+
+
+def test_class_integrals_built_on_first_distribution():
+    rng = np.random.default_rng(7)
+    image = rng.integers(0, 256, (70, 150, 3), dtype=np.uint8)
+    core = LunarFeOCore()
+    core.clementine_image = image
+    assert core.class_integrals is None
+    result = core.analyze_region_distribution(60, -60, 120, -120)
+    assert core.class_integrals is not None
+    x1, y1, x2, y2 = core.normalize_pixel_box(*result["pixel_box"], 70, 150)
+    expected = np.bincount(np.searchsorted(REFERENCE_FEO, [reference_feo(color) for color in
+                                                            image[y1:y2, x1:x2].reshape(-1, 3)]),
+                           minlength=len(REFERENCE_FEO))
+    assert result["feo_fractions"] == dict(zip(REFERENCE_FEO.tolist(), (expected / expected.sum()).tolist()))
+
+
+def test_class_integrals_bands_match_single_pass(monkeypatch):
+    image = random_colors(37 * 50, 8).reshape(37, 50, 3)
+    core = LunarFeOCore()
+    single = core.build_class_integrals(image)
+    monkeypatch.setattr(lunar_core, "READ_CHUNK_PIXELS", 4 * 50)  # Faixas de 4 linhas
+    np.testing.assert_array_equal(core.build_class_integrals(image), single)
@@ -0,0 +1,35 @@
+import io
+import json
+
+import numpy as np
+
+from lunar_cli import analyze_record
+from lunar_core import LunarFeOCore
+from lunar_stats import AnalysisStats
+
+
+def make_core(log):
+    core = LunarFeOCore(precompute=False, stats=AnalysisStats(log_stream=log))
+    core.clementine_image = np.random.default_rng(12).integers(0, 256, (60, 120, 3), dtype=np.uint8)
+    core.integral_image = core.build_integral_image(core.clementine_image)
+    return core
+
+
+def test_parse_is_timed_inside_the_query():
+    log = io.StringIO()
+    core = make_core(log)
+    output = analyze_record(core, {"max_ns": "10", "min_ns": "-10", "max_ol": "30", "min_ol": "-20"})
+    assert output["error"] is None
+    (line,) = log.getvalue().splitlines()                          # Uma única linha por região
+    query = json.loads(line)
+    assert query["region"] == [10.0, -10.0, 30.0, -20.0]
+    assert {"parse", "validate", "average"} <= set(query["stages"])
+
+
+def test_invalid_record_is_logged_with_its_parse_stage():
+    log = io.StringIO()
+    core = make_core(log)
+    output = analyze_record(core, {"max_ns": "dez", "min_ns": "-10", "max_ol": "30", "min_ol": "-20"})
+    assert "dez" in output["error"]
+    query = json.loads(log.getvalue())
+    assert query["error"] == "ValueError" and "parse" in query["stages"]
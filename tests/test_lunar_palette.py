@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from lunar_core import REFERENCE_FEO, REFERENCE_RGB
+from lunar_palette import DensePalette
+
+cv2 = pytest.importorskip("cv2")
+
+
+def write_scale(path):
+    """
+    Escala sintética: barra horizontal com as cores de referência interpoladas, sobre fundo branco
+    """
+    positions = np.linspace(0, len(REFERENCE_RGB) - 1, 400)
+    bar = np.stack([np.interp(positions, np.arange(len(REFERENCE_RGB)), REFERENCE_RGB[:, channel])
+                    for channel in range(3)], axis=1)
+    image = np.full((80, 440, 3), 255, dtype=np.uint8)
+    image[20:60, 20:420] = bar[None, :, ::-1].round()             # RGB->BGR
+    cv2.imwrite(path, image)
+
+
+def test_lookup_table_matches_exact_search(tmp_path):
+    path = str(tmp_path / "escala.png")
+    write_scale(path)
+    palette = DensePalette.build(path, REFERENCE_RGB[0], (REFERENCE_FEO[0], REFERENCE_FEO[-1]), samples=32)
+    colors = np.random.default_rng(10).integers(0, 256, (200000, 3), dtype=np.uint8)
+    colors[:3] = [[0, 0, 255], [255, 60, 30], [0, 255, 0]]         # Vermelho, azul e verde puros (BGR)
+    np.testing.assert_array_equal(palette.classify_colors(colors), palette.classify_colors(colors.astype(np.float64)))
+
+    palette.save(DensePalette.default_path(path), path)
+    loaded = DensePalette.load(path, samples=32)
+    assert palette.lut.dtype == loaded.lut.dtype == np.uint8      # Índice de 1 byte com até 256 cores
+    np.testing.assert_array_equal(loaded.lut, palette.lut)
+    assert DensePalette.load(path, samples=32, bits=7) is None    # Outra quantização: reconstrói
+
+
+def test_palette_without_lookup_table_uses_exact_search(tmp_path):
+    path = str(tmp_path / "escala.png")
+    write_scale(path)
+    palette = DensePalette.build(path, REFERENCE_RGB[0], (REFERENCE_FEO[0], REFERENCE_FEO[-1]), samples=32)
+    palette.save(DensePalette.default_path(path), path)
+    colors = np.random.default_rng(11).integers(0, 256, (5000, 3), dtype=np.uint8)
+    loaded = DensePalette.load(path, samples=32, lut=False)
+    assert loaded.lut is None
+    np.testing.assert_array_equal(loaded.classify_colors(colors), palette.classify_colors(colors))
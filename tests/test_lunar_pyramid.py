@@ -0,0 +1,36 @@
+import numpy as np
+
+from lunar_core import LunarFeOCore
+from lunar_pyramid import FeOPyramid
+
+
+def build_pyramid(tmp_path, image):
+    path = str(tmp_path / "mosaico.npy")
+    np.save(path, image)
+    core = LunarFeOCore(path)
+    core.clementine_image = image
+    return core, FeOPyramid.build(core)
+
+
+def test_aligned_query_matches_exact_mean(tmp_path):
+    image = np.random.default_rng(5).integers(0, 256, (75, 130, 3), dtype=np.uint8)
+    _, pyramid = build_pyramid(tmp_path, image)
+    for level in pyramid.levels[:4]:
+        scale = 2 ** level
+        right, bottom = -(-130 // scale) * scale, -(-75 // scale) * scale  # Inclui células parciais da borda
+        color, box = pyramid.query(scale, scale, right, bottom, level)
+        x1, y1, x2, y2 = box
+        assert box == (scale, scale, 130, 75)
+        np.testing.assert_allclose(color, image[y1:y2, x1:x2].mean(axis=(0, 1)), rtol=1e-5)
+    assert FeOPyramid.load(str(tmp_path / "mosaico.npy")).levels == pyramid.levels
+
+
+def test_pyramid_only_used_without_integral_table(tmp_path):
+    image = np.random.default_rng(6).integers(0, 256, (90, 180, 3), dtype=np.uint8)
+    core, core.pyramid = build_pyramid(tmp_path, image)
+    assert core.analyze_region(40, -40, 80, -80, tolerance=8)["level"] > 0
+    core.integral_image = core.build_integral_image(image)
+    result = core.analyze_region(40, -40, 80, -80, tolerance=8)
+    assert result["level"] == 0
+    x1, y1, x2, y2 = result["pixel_box"]
+    np.testing.assert_allclose(result["color"], image[y1:y2, x1:x2].mean(axis=(0, 1)))
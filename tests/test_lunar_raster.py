@@ -0,0 +1,114 @@
+import os
+import struct
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from lunar_raster import is_tiled_tiff, open_raster
+
+tifffile = pytest.importorskip("tifffile")
+cv2 = pytest.importorskip("cv2")
+
+JPEG_COMPRESSION = 7                                               # Compressão que exige o imagecodecs
+
+
+def imagecodecs_available():
+    try:
+        import imagecodecs                                         # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def sample_image(seed=0):
+    return np.random.default_rng(seed).integers(0, 256, (40, 60, 3), dtype=np.uint8)
+
+
+def test_tiled_tiff_is_read_by_tiles(tmp_path):
+    image = sample_image()
+    path = str(tmp_path / "tiled.tif")
+    tifffile.imwrite(path, image[:, :, ::-1], tile=(16, 16))       # TIFF em RGB
+    assert is_tiled_tiff(path)
+    raster = open_raster(path)
+    try:
+        np.testing.assert_array_equal(raster.read_window(0, 0, 60, 40), image)
+    finally:
+        raster.close()
+
+
+@pytest.mark.skipif(imagecodecs_available(), reason="imagecodecs decodifica blocos JPEG")
+def test_undecodable_tiles_are_not_tiled(tmp_path):
+    path = str(tmp_path / "tiled.tif")
+    tifffile.imwrite(path, sample_image()[:, :, ::-1], tile=(16, 16))
+    with tifffile.TiffFile(path) as tiff:                          # Marca os blocos como JPEG
+        offset = tiff.pages[0].tags["Compression"].valueoffset
+        byteorder = tiff.byteorder
+    with open(path, "r+b") as handle:
+        handle.seek(offset)
+        handle.write(struct.pack(byteorder + "H", JPEG_COMPRESSION))
+    assert not is_tiled_tiff(path)
+
+
+@pytest.mark.skipif(imagecodecs_available(), reason="imagecodecs decodifica TIFFs JPEG")
+def test_compressed_tiff_falls_back_to_opencv(tmp_path):
+    path = str(tmp_path / "jpeg.tif")
+    assert cv2.imwrite(path, sample_image(), [cv2.IMWRITE_TIFF_COMPRESSION, JPEG_COMPRESSION])
+    raster = open_raster(path)                                     # Decodificado pelo OpenCV
+    try:
+        np.testing.assert_array_equal(raster.read_window(0, 0, 60, 40), cv2.imread(path))
+    finally:
+        raster.close()
+    assert os.path.exists(path + ".npy")
+
+
+def test_optional_dependencies_are_not_imported_eagerly():
+    code = "import sys, lunar_raster; print('tifffile' in sys.modules, 'cv2' in sys.modules)"
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert output.stdout.split() == ["False", "False"]
+
+
+def write_palette_tiff(path):
+    indices = np.random.default_rng(1).integers(0, 4, (40, 60), dtype=np.uint8)
+    colormap = np.zeros((3, 256), dtype=np.uint16)
+    colormap[:, :4] = np.array([[255, 0, 0], [0, 255, 0], [0, 0, 255], [255, 255, 0]]).T * 257
+    tifffile.imwrite(path, indices, photometric="palette", colormap=colormap)
+
+
+@pytest.mark.parametrize("kind", ["palette", "planar", "planar_tiled"])
+def test_unsupported_layouts_fall_back_to_opencv(tmp_path, kind):
+    path = str(tmp_path / f"{kind}.tif")
+    if kind == "palette":
+        write_palette_tiff(path)
+    else:
+        planes = sample_image().transpose(2, 0, 1)                 # Planos R, G e B separados
+        tifffile.imwrite(path, planes, photometric="rgb", planarconfig="separate",
+                         tile=(16, 16) if kind == "planar_tiled" else None)
+    expected = cv2.imread(path)
+    assert expected is not None and expected.shape == (40, 60, 3)
+    assert not is_tiled_tiff(path)
+    raster = open_raster(path)
+    try:
+        assert raster.shape == (40, 60, 3)
+        np.testing.assert_array_equal(raster.read_window(0, 0, 60, 40), expected)
+    finally:
+        raster.close()
+
+
+def test_grayscale_tiled_tiff_is_expanded_to_bgr(tmp_path):
+    from lunar_core import LunarFeOCore
+
+    gray = sample_image()[:, :, 0]
+    path = str(tmp_path / "cinza.tif")
+    tifffile.imwrite(path, gray, photometric="minisblack", tile=(16, 16))
+    assert is_tiled_tiff(path)
+    core = LunarFeOCore(precompute=False)
+    core.clementine_image = open_raster(path)
+    try:
+        np.testing.assert_array_equal(core.clementine_image.read_window(0, 0, 60, 40), cv2.imread(path))
+        fractions = core.analyze_region_distribution(90, -90, 180, -180)["feo_fractions"]
+        assert sum(fractions.values()) == pytest.approx(1.0)
+    finally:
+        core.clementine_image.close()
@@ -0,0 +1,80 @@
+import glob
+import json
+import socket
+
+import numpy as np
+import pytest
+
+from lunar_core import LunarFeOCore
+from lunar_service import QueryService, ServiceClient, release_blocks, share_core
+
+
+@pytest.fixture
+def core():
+    core = LunarFeOCore(precompute=False)
+    core.clementine_image = np.random.default_rng(9).integers(0, 256, (60, 120, 3), dtype=np.uint8)
+    core.integral_image = core.build_integral_image(core.clementine_image)
+    return core
+
+
+def raw_request(connection, request):
+    """
+    Envia um pedido HTTP cru e retorna o código de status da resposta
+    """
+    connection.sendall(request)
+    reader = connection.makefile("rb")
+    status = int(reader.readline().split()[1])
+    length = 0
+    for line in iter(reader.readline, b"\r\n"):                    # Cabeçalhos até a linha vazia
+        name, _, value = line.decode().partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    reader.read(length)
+    return status
+
+
+def test_bad_region_fails_only_its_request(core):
+    service = QueryService(core, port=0, workers=1, batch_window=0.05).start()
+    try:
+        client = ServiceClient(*service.address)
+        with pytest.raises(RuntimeError, match="objeto"):
+            client.request("POST", "/query", {"regions": [5]})
+        result = client.analyze(10, -10, 30, -20)
+        assert result["error"] is None
+        client.close()
+    finally:
+        service.close()
+
+
+def test_unknown_post_route_keeps_connection_usable(core):
+    service = QueryService(core, port=0, workers=1).start()
+    try:
+        with socket.create_connection(service.address) as connection:
+            body = json.dumps({"max_ns": 10, "min_ns": -10, "max_ol": 30, "min_ol": -20}).encode()
+            head = f"Content-Length: {len(body)}\r\nContent-Type: application/json\r\n\r\n".encode()
+            assert raw_request(connection, b"POST /outra HTTP/1.1\r\nHost: x\r\n" + head + body) == 404
+            assert raw_request(connection, b"POST /query HTTP/1.1\r\nHost: x\r\n" + head + body) == 200
+    finally:
+        service.close()
+
+
+def test_bind_failure_does_not_leak_shared_memory(core):
+    before = set(glob.glob("/dev/shm/psm_*"))
+    with socket.socket() as busy:
+        busy.bind(("127.0.0.1", 0))
+        busy.listen()
+        with pytest.raises(OSError):
+            QueryService(core, port=busy.getsockname()[1], workers=1)
+    assert set(glob.glob("/dev/shm/psm_*")) == before
+
+
+@pytest.mark.parametrize("distribution", [False, True])
+def test_class_integrals_shared_only_with_distribution(distribution):
+    core = LunarFeOCore()
+    core.clementine_image = np.random.default_rng(9).integers(0, 256, (60, 120, 3), dtype=np.uint8)
+    description, blocks = share_core(core, distribution)
+    try:
+        assert ("class_integrals" in description["arrays"]) == distribution
+        assert (core.class_integrals is not None) == distribution
+    finally:
+        release_blocks(blocks)